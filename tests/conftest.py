@@ -36,4 +36,8 @@ assert any(app in INSTALLED_APPS for app in ['posts.apps.PostsConfig', 'posts'])
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
+    'tests.fixtures.fixture_query_budget',
+    'tests.fixtures.fixture_cache',
+    'tests.fixtures.fixture_media',
+    'tests.fixtures.fixture_workers',
 ]
@@ -0,0 +1,10 @@
+import pytest
+
+from core.test_runner import isolated_cache
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_cache_file():
+    """Тесты не трогают файл кэша развертывания."""
+    with isolated_cache():
+        yield
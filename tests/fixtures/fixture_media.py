@@ -0,0 +1,10 @@
+import pytest
+
+from core.test_runner import isolated_media
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_media_root():
+    """Картинки тестов не попадают в MEDIA_ROOT развертывания."""
+    with isolated_media():
+        yield
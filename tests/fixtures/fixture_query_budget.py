@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def query_budgets(settings):
+    """Превышение бюджета запросов представления валит тест."""
+    settings.QUERY_BUDGETS = 'raise'
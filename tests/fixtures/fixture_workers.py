@@ -0,0 +1,11 @@
+import pytest
+
+from core.test_runner import inline_workers
+
+
+@pytest.fixture(scope='session', autouse=True)
+def inline_thumbnail_workers():
+    """Картинки обрабатываются в процессе тестов, а не в воркерах с
+    настройками развертывания."""
+    with inline_workers():
+        yield
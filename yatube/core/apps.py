@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished, request_started
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .db import (
+            apply_pragmas, check_connections, mark_connections_idle,
+        )
+        connection_created.connect(apply_pragmas)
+        request_started.connect(check_connections)
+        request_finished.connect(mark_connections_idle)
@@ -0,0 +1,220 @@
+"""Замеры представлений через WSGI-приложение проекта.
+
+Запросы идут прямо в yatube.wsgi.application, минуя сеть, но через все
+middleware, поэтому время включает кэш, сессии и рендеринг. Нагрузку
+создают потоки одного процесса: абсолютные числа ниже, чем у gunicorn с
+несколькими воркерами, но для сравнения двух версий кода на одной машине
+этого достаточно. Результаты сохраняются в JSON, который потом можно
+передать как базовую линию.
+"""
+import json
+import math
+import platform
+import subprocess
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from http.cookies import SimpleCookie
+from io import BytesIO
+from urllib.parse import urlencode, urlsplit
+
+from django import get_version
+from django.conf import settings
+from django.db import connections
+
+HOST = 'localhost'
+# Адрес не из INTERNAL_IPS: debug_toolbar не должен попадать в замеры.
+REMOTE_ADDR = '192.0.2.1'
+PERCENTILES = (50, 95, 99)
+SCENARIO_KEY = ('view', 'depth', 'concurrency')
+
+
+class Response:
+    def __init__(self, status, headers, latency, queries):
+        self.status = status
+        self.headers = headers
+        self.latency = latency
+        self.queries = queries
+
+    @property
+    def cookies(self):
+        cookies = SimpleCookie()
+        for name, value in self.headers:
+            if name.lower() == 'set-cookie':
+                cookies.load(value)
+        return {name: morsel.value for name, morsel in cookies.items()}
+
+
+def wsgi_request(application, path, method='GET', data=None, cookies=None,
+                 headers=None):
+    """Выполняет запрос к WSGI-приложению и читает ответ целиком.
+
+    Время ответа включает выдачу тела, число SQL-запросов считается по
+    всем базам в текущем потоке, где приложение и выполняет запрос.
+    """
+    url = urlsplit(path)
+    body = urlencode(data or {}).encode()
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': HOST,
+        'REMOTE_ADDR': REMOTE_ADDR,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if data is not None:
+        environ['CONTENT_TYPE'] = 'application/x-www-form-urlencoded'
+    if cookies:
+        environ['HTTP_COOKIE'] = '; '.join(
+            f'{name}={value}' for name, value in cookies.items())
+    for name, value in (headers or {}).items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    started = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        started['status'] = int(status.split()[0])
+        started['headers'] = response_headers
+
+    queries = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    begin = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(count_query))
+        result = application(environ, start_response)
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+    latency = time.perf_counter() - begin
+    return Response(started['status'], started['headers'], latency, queries)
+
+
+def percentile(values, share):
+    """Значение, не меньше которого share процентов выборки (nearest rank)."""
+    ordered = sorted(values)
+    rank = max(math.ceil(share / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(responses, elapsed):
+    latencies = [response.latency for response in responses]
+    summary = {
+        'requests': len(responses),
+        'errors': sum(response.status >= 400 for response in responses),
+        'throughput': len(responses) / elapsed if elapsed else 0.0,
+        'mean_ms': 1000 * sum(latencies) / len(latencies),
+        'queries_per_request': sum(
+            response.queries for response in responses) / len(responses),
+    }
+    for share in PERCENTILES:
+        summary[f'p{share}_ms'] = 1000 * percentile(latencies, share)
+    return summary
+
+
+def run_load(send, requests, concurrency, warmup=0):
+    """Отправляет requests запросов из concurrency потоков.
+
+    send(number) выполняет один запрос и возвращает Response. Первые
+    warmup запросов выполняются до замера и в статистику не входят.
+    """
+    for number in range(warmup):
+        send(number)
+    responses = []
+    counter = iter(range(warmup, warmup + requests))
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    number = next(counter, None)
+                if number is None:
+                    return
+                response = send(number)
+                with lock:
+                    responses.append(response)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    begin = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(responses, time.perf_counter() - begin)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'django': get_version(),
+        'debug': settings.DEBUG,
+        'machine': platform.platform(),
+    }
+
+
+def scenario_key(result):
+    return tuple(result[name] for name in SCENARIO_KEY)
+
+
+def compare(results, baseline):
+    """Изменения сценариев относительно базовой линии, в процентах.
+
+    Сравниваются только сценарии, которые есть в обоих замерах.
+    """
+    previous = {scenario_key(result): result for result in baseline}
+    changes = []
+    for result in results:
+        before = previous.get(scenario_key(result))
+        if before is None:
+            continue
+        change = {name: result[name] for name in SCENARIO_KEY}
+        for field in [f'p{share}_ms' for share in PERCENTILES] + [
+                'throughput', 'queries_per_request']:
+            change[field] = (
+                100 * (result[field] - before[field]) / before[field]
+                if before[field] else None)
+        changes.append(change)
+    return changes
+
+
+def save_report(path, results, meta):
+    with open(path, 'w') as report:
+        json.dump({'meta': meta, 'results': results}, report,
+                  ensure_ascii=False, indent=2)
+
+
+def load_results(path):
+    with open(path) as report:
+        return json.load(report)['results']
@@ -0,0 +1,350 @@
+"""Кэш, общий для всех процессов одного хоста, без внешних сервисов.
+
+SQLiteCache хранит записи в файле SQLite в режиме WAL: читатели не
+блокируют писателя, а все воркеры gunicorn видят одни и те же данные и
+инвалидации. Объем ограничен MAX_BYTES, при переполнении вытесняются
+записи, к которым дольше всего не обращались.
+
+TwoTierCache добавляет перед файлом небольшой LRU-кэш в памяти процесса.
+Значение из него отдается, только если штамп записи в общем файле не
+изменился, поэтому запись из другого процесса сразу видна всем.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import record_cache, timing
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL,'
+    ' accessed REAL NOT NULL, size INTEGER NOT NULL, stamp INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE TABLE IF NOT EXISTS cache_meta ('
+    ' id INTEGER PRIMARY KEY, total INTEGER NOT NULL)',
+    'INSERT OR IGNORE INTO cache_meta VALUES (1, 0)',
+    'CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN'
+    ' UPDATE cache_meta SET total = total + NEW.size; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN'
+    ' UPDATE cache_meta SET total = total - OLD.size; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_resize AFTER UPDATE OF size ON cache'
+    ' BEGIN UPDATE cache_meta SET total = total - OLD.size + NEW.size; END',
+)
+MAX_BYTES = 64 * 1024 * 1024
+CULL_TARGET = 0.9
+CULL_BATCH = 100
+ACCESS_RESOLUTION = 10
+BUSY_TIMEOUT = 5000
+L1_MAX_ENTRIES = 1000
+# SQLite по умолчанию ограничивает число параметров запроса 999.
+MAX_PARAMS = 900
+
+
+def chunks(items, size=MAX_PARAMS):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.max_bytes = int(options.get('MAX_BYTES', MAX_BYTES))
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # Соединение нельзя переносить между потоками и через fork.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(self.location, isolation_level=None)
+            connection.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT}')
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute('PRAGMA recursive_triggers = ON')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    def _write(self, statements):
+        """Выполняет запросы одной транзакцией, возвращает их rowcount."""
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            rowcounts = [
+                connection.execute(sql, params).rowcount
+                for sql, params in statements
+            ]
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return rowcounts
+
+    def _select(self, keys):
+        """Строки ключей: {key: (value, stamp)}, без просроченных."""
+        now = time.time()
+        rows = {}
+        stale_access = []
+        for part in chunks(keys):
+            placeholders = ', '.join('?' * len(part))
+            cursor = self.connection.execute(
+                'SELECT key, value, expires, accessed, stamp FROM cache'
+                f' WHERE key IN ({placeholders})', part)
+            for key, value, expires, accessed, stamp in cursor:
+                if expires is not None and expires <= now:
+                    continue
+                if accessed < now - ACCESS_RESOLUTION:
+                    stale_access.append(key)
+                rows[key] = (value, stamp)
+        self._touch_access(stale_access, now)
+        return rows
+
+    def _touch_access(self, keys, now):
+        # Время доступа обновляется грубо, чтобы чтение почти не писало.
+        for part in chunks(keys):
+            placeholders = ', '.join('?' * len(part))
+            self.connection.execute(
+                f'UPDATE cache SET accessed = ? WHERE key IN ({placeholders})',
+                [now] + part)
+
+    def _upsert(self, data, timeout, only_new=False):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        stamp = time.time_ns()
+        statements = []
+        for key, value in data.items():
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            if only_new:
+                statements.append((
+                    'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                    (key, now)))
+            statements.append((
+                'INSERT OR {} INTO cache'
+                ' (key, value, expires, accessed, size, stamp)'
+                ' VALUES (?, ?, ?, ?, ?, ?)'.format(
+                    'IGNORE' if only_new else 'REPLACE'),
+                (key, blob, expires, now, len(key) + len(blob), stamp)))
+        rowcounts = self._write(statements)
+        self._cull()
+        return rowcounts
+
+    def _cull(self):
+        total, = self.connection.execute(
+            'SELECT total FROM cache_meta').fetchone()
+        if total <= self.max_bytes:
+            return
+        self._write([(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),))])
+        target = self.max_bytes * CULL_TARGET
+        while True:
+            total, = self.connection.execute(
+                'SELECT total FROM cache_meta').fetchone()
+            if total <= target:
+                return
+            oldest = self.connection.execute(
+                'SELECT key, size FROM cache ORDER BY accessed LIMIT ?',
+                (CULL_BATCH,))
+            victims = []
+            for key, size in oldest:
+                victims.append(key)
+                total -= size
+                if total <= target:
+                    break
+            if not victims:
+                return
+            self._delete(victims)
+
+    def _delete(self, keys):
+        self._write([
+            ('DELETE FROM cache WHERE key IN ({})'.format(
+                ', '.join('?' * len(part))), part)
+            for part in chunks(keys)
+        ])
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    @timing('cache_seconds')
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        row = self._select([key]).get(key)
+        record_cache(row is not None, row is None)
+        if row is None:
+            return default
+        return pickle.loads(row[0])
+
+    @timing('cache_seconds')
+    def get_many(self, keys, version=None):
+        made = {self._key(key, version): key for key in keys}
+        rows = self._select(list(made))
+        record_cache(len(rows), len(made) - len(rows))
+        return {
+            made[key]: pickle.loads(value)
+            for key, (value, _) in rows.items()
+        }
+
+    @timing('cache_seconds')
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._upsert({self._key(key, version): value}, timeout)
+
+    @timing('cache_seconds')
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._upsert(
+            {self._key(key, version): value for key, value in data.items()},
+            timeout,
+        )
+        return []
+
+    @timing('cache_seconds')
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        rowcounts = self._upsert({key: value}, timeout, only_new=True)
+        return rowcounts[-1] > 0
+
+    @timing('cache_seconds')
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self.connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()))
+        return cursor.rowcount > 0
+
+    @timing('cache_seconds')
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value, expires FROM cache WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ?, stamp = ?'
+                ' WHERE key = ?',
+                (blob, len(key) + len(blob), time.time_ns(), key))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    @timing('cache_seconds')
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return key in self._select([key])
+
+    @timing('cache_seconds')
+    def delete(self, key, version=None):
+        self._delete([self._key(key, version)])
+
+    @timing('cache_seconds')
+    def delete_many(self, keys, version=None):
+        self._delete([self._key(key, version) for key in keys])
+
+    @timing('cache_seconds')
+    def clear(self):
+        self._write([('DELETE FROM cache', ())])
+
+    def close(self, **kwargs):
+        # Соединение живет столько же, сколько поток: открывать файл
+        # заново на каждый запрос дороже, чем держать его открытым.
+        pass
+
+
+class TwoTierCache(SQLiteCache):
+    """SQLiteCache с LRU-кэшем значений в памяти процесса (L1).
+
+    L1 хранит сериализованное значение вместе со штампом записи в файле.
+    Чтение сверяет только штампы - короткий запрос по первичному ключу
+    без чтения самого значения, - а значение берет из L1, если штамп совпал.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        options = params.get('OPTIONS', {})
+        self.l1_max_entries = int(
+            options.get('L1_MAX_ENTRIES', L1_MAX_ENTRIES))
+        self._l1 = OrderedDict()
+        self._l1_lock = threading.Lock()
+
+    def _l1_get(self, key):
+        with self._l1_lock:
+            entry = self._l1.get(key)
+            if entry is not None:
+                self._l1.move_to_end(key)
+            return entry
+
+    def _l1_put(self, key, value, stamp):
+        with self._l1_lock:
+            self._l1[key] = (value, stamp)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_discard(self, keys):
+        with self._l1_lock:
+            for key in keys:
+                self._l1.pop(key, None)
+
+    def _select(self, keys):
+        now = time.time()
+        cached = {key: self._l1_get(key) for key in keys}
+        known = [key for key, entry in cached.items() if entry is not None]
+        rows = {}
+        stale_access = []
+        for part in chunks(known):
+            placeholders = ', '.join('?' * len(part))
+            cursor = self.connection.execute(
+                'SELECT key, expires, accessed, stamp FROM cache'
+                f' WHERE key IN ({placeholders})', part)
+            for key, expires, accessed, stamp in cursor:
+                if expires is not None and expires <= now:
+                    continue
+                if cached[key][1] == stamp:
+                    rows[key] = cached[key]
+                    if accessed < now - ACCESS_RESOLUTION:
+                        stale_access.append(key)
+        self._touch_access(stale_access, now)
+        self._l1_discard([key for key in known if key not in rows])
+        missing = [key for key in keys if key not in rows]
+        if missing:
+            fetched = super()._select(missing)
+            for key, (value, stamp) in fetched.items():
+                self._l1_put(key, value, stamp)
+            rows.update(fetched)
+        return rows
+
+    def _upsert(self, data, timeout, only_new=False):
+        self._l1_discard(data)
+        return super()._upsert(data, timeout, only_new)
+
+    @timing('cache_seconds')
+    def incr(self, key, delta=1, version=None):
+        self._l1_discard([self._key(key, version)])
+        return super().incr(key, delta, version)
+
+    def _delete(self, keys):
+        self._l1_discard(keys)
+        super()._delete(keys)
+
+    @timing('cache_seconds')
+    def clear(self):
+        with self._l1_lock:
+            self._l1.clear()
+        super().clear()
@@ -0,0 +1,56 @@
+"""Настройка соединений с SQLite.
+
+apply_pragmas выполняет PRAGMA из settings.SQLITE_PRAGMAS на каждом новом
+соединении. WAL позволяет читателям не блокировать писателя, busy_timeout
+заставляет писателя ждать блокировку, а не сразу падать с "database is
+locked", mmap_size отдает чтение страниц отображению файла в память.
+
+Соединения живут CONN_MAX_AGE секунд. Для сетевых баз check_connections в
+начале запроса проверяет соединения с ключом CONN_HEALTH_CHECKS в
+DATABASES, как это делают новые версии Django; Django 2.2 этот ключ не
+читает. Проверяются только соединения, простоявшие дольше
+HEALTH_CHECK_IDLE: сломанное закрывается, и запрос открывает новое.
+Соединения с SQLite не проверяются - это файл в том же процессе, ему
+нечему устаревать, а SELECT 1 стоил бы запроса на каждый запрос.
+"""
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+HEALTH_CHECK_IDLE = 60
+
+
+def pragma_statements(pragmas):
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(settings.SQLITE_PRAGMAS):
+            cursor.execute(statement)
+
+
+def check_connections(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if (connection.vendor == 'sqlite'
+                or connection.connection is None
+                or connection.in_atomic_block
+                or not connection.settings_dict.get('CONN_HEALTH_CHECKS')
+                or now - getattr(connection, 'idle_since', 0)
+                < HEALTH_CHECK_IDLE):
+            continue
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except DatabaseError:
+            connection.close()
+
+
+def mark_connections_idle(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        connection.idle_since = now
@@ -0,0 +1,103 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import pragma_statements
+
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, author_id INTEGER NOT NULL,'
+    ' pub_date REAL NOT NULL, text TEXT NOT NULL)',
+    'CREATE INDEX post_author_pub_date ON post (author_id, pub_date)',
+)
+READ_SQL = (
+    'SELECT id, author_id, pub_date, text FROM post WHERE author_id = ?'
+    ' ORDER BY pub_date DESC, id DESC LIMIT 10')
+WRITE_SQL = 'INSERT INTO post (author_id, pub_date, text) VALUES (?, ?, ?)'
+AUTHORS = 100
+TEXT = 'Текст поста для замера. ' * 20
+
+
+def prepare(path, rows):
+    connection = sqlite3.connect(path)
+    for statement in SCHEMA:
+        connection.execute(statement)
+    now = time.time()
+    connection.executemany(WRITE_SQL, (
+        (number % AUTHORS, now - number, TEXT) for number in range(rows)))
+    connection.commit()
+    connection.close()
+
+
+def run_worker(path, pragmas, deadline, write_ratio, totals, lock):
+    # Как в Django: автокоммит и таймаут sqlite3 по умолчанию (5 секунд).
+    connection = sqlite3.connect(path, isolation_level=None)
+    for statement in pragma_statements(pragmas):
+        connection.execute(statement)
+    reads = writes = errors = 0
+    while time.monotonic() < deadline:
+        author_id = random.randrange(AUTHORS)
+        try:
+            if random.random() < write_ratio:
+                connection.execute(WRITE_SQL, (author_id, time.time(), TEXT))
+                writes += 1
+            else:
+                connection.execute(READ_SQL, (author_id,)).fetchall()
+                reads += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    connection.close()
+    with lock:
+        totals['reads'] += reads
+        totals['writes'] += writes
+        totals['errors'] += errors
+
+
+def run_profile(pragmas, threads, seconds, write_ratio, rows):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.sqlite3')
+        prepare(path, rows)
+        totals = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+        workers = [
+            threading.Thread(target=run_worker, args=(
+                path, pragmas, deadline, write_ratio, totals, lock))
+            for _ in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    return totals
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite на смеси чтений и '
+            'записей без PRAGMA и с settings.SQLITE_PRAGMAS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.1,
+            help='Доля записей среди операций.',
+        )
+        parser.add_argument(
+            '--rows', type=int, default=10000,
+            help='Сколько постов в базе перед замером.',
+        )
+
+    def handle(self, *args, threads, seconds, write_ratio, rows, **options):
+        profiles = {'default': {}, 'tuned': settings.SQLITE_PRAGMAS}
+        for name, pragmas in profiles.items():
+            totals = run_profile(pragmas, threads, seconds, write_ratio, rows)
+            self.stdout.write(
+                '{}: чтений {:.0f}/с, записей {:.0f}/с, ошибок {}'.format(
+                    name, totals['reads'] / seconds,
+                    totals['writes'] / seconds, totals['errors']))
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.replicas import mark_synced, sync_replica
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в реплики из '
+            'settings.REPLICA_DATABASES.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять синхронизацию каждые N секунд; 0 - один раз.',
+        )
+
+    def handle(self, *args, interval, **options):
+        source = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+        while True:
+            for alias in settings.REPLICA_DATABASES:
+                # Момент до начала копии: реплика содержит все записи,
+                # сделанные раньше него.
+                started = time.time_ns()
+                sync_replica(source, connections[alias].settings_dict['NAME'])
+                mark_synced(alias, started)
+                self.stdout.write(f'{alias}: синхронизирована')
+            if not interval:
+                return
+            time.sleep(interval)
@@ -0,0 +1,283 @@
+"""Метрики запросов по представлениям в формате Prometheus.
+
+MetricsMiddleware собирает для каждого запроса время ответа, число и время
+SQL-запросов, попадания, промахи и время кэша, время рендеринга шаблонов и
+поиска миниатюр и складывает их в счетчики процесса по имени
+представления. С settings.SERVER_TIMING то же время по участкам уходит
+клиенту в заголовке Server-Timing. Счетчики не
+реже раза в METRICS_FLUSH_INTERVAL секунд копируются в общий кэш, поэтому
+/metrics отдает сумму по всем процессам, а сам запрос платит только за
+несколько вызовов perf_counter.
+"""
+import os
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+PREFIX = 'yatube'
+# Границы корзин гистограммы времени ответа, секунды.
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+COUNTERS = {
+    'requests': 'Число запросов',
+    'latency_sum': 'Суммарное время ответа, секунды',
+    'db_queries': 'Число SQL-запросов',
+    'db_seconds': 'Суммарное время SQL-запросов, секунды',
+    'cache_hits': 'Попадания в кэш',
+    'cache_misses': 'Промахи кэша',
+    'cache_seconds': 'Суммарное время обращений к кэшу, секунды',
+    'template_seconds': 'Суммарное время рендеринга шаблонов, секунды',
+    'thumbnail_seconds': 'Суммарное время поиска миниатюр, секунды',
+}
+# Участки для Server-Timing: имя и поле RequestMetrics.
+TIMING_FIELDS = (
+    ('db', 'db_seconds'),
+    ('cache', 'cache_seconds'),
+    ('template', 'template_seconds'),
+    ('thumbnail', 'thumbnail_seconds'),
+)
+METRICS_KEY = 'metrics:{}'
+METRICS_PIDS_KEY = 'metrics:pids'
+METRICS_FLUSH_INTERVAL = 10
+METRICS_TIMEOUT = 60 * 10
+UNRESOLVED = 'unresolved'
+
+current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Счетчики одного запроса.
+
+    Время каждого участка - собственное: из времени шаблона вычитаются
+    выполненные в нем SQL-запросы и обращения к кэшу, поэтому участки
+    вместе с view (остальной код) в сумме дают время всего запроса.
+    """
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_seconds = 0.0
+        self.template_seconds = 0.0
+        self.thumbnail_seconds = 0.0
+        self.stack = []
+
+
+class timing:
+    """Засекает собственное время участка field текущего запроса.
+
+    Вложенный участок того же вида, например TwoTierCache.incr, который
+    вызывает SQLiteCache.incr, отдельно не считается.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __enter__(self):
+        self.metrics = current.get()
+        if self.metrics is None or (
+                self.metrics.stack
+                and self.metrics.stack[-1][0] == self.field):
+            self.metrics = None
+            return
+        self.metrics.stack.append([self.field, 0.0])
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.metrics is None:
+            return
+        elapsed = time.perf_counter() - self.started
+        _, nested = self.metrics.stack.pop()
+        setattr(self.metrics, self.field,
+                getattr(self.metrics, self.field) + elapsed - nested)
+        if self.metrics.stack:
+            self.metrics.stack[-1][1] += elapsed
+
+    def __call__(self, function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timing(self.field):
+                return function(*args, **kwargs)
+        return wrapper
+
+
+def record_cache(hits, misses):
+    metrics = current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def empty_stats():
+    stats = dict.fromkeys(COUNTERS, 0)
+    stats['buckets'] = [0] * len(LATENCY_BUCKETS)
+    return stats
+
+
+def merge_stats(target, source):
+    for name in COUNTERS:
+        target[name] += source[name]
+    target['buckets'] = [
+        total + count
+        for total, count in zip(target['buckets'], source['buckets'])
+    ]
+
+
+class Registry:
+    """Счетчики процесса: {имя представления: статистика}."""
+
+    def __init__(self):
+        self.views = {}
+        self.lock = threading.Lock()
+        self.flushed_at = 0.0
+
+    def observe(self, view_name, latency, metrics):
+        with self.lock:
+            stats = self.views.setdefault(view_name, empty_stats())
+            stats['requests'] += 1
+            stats['latency_sum'] += latency
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats['buckets'][index] += 1
+                    break
+            for name in COUNTERS:
+                if name not in ('requests', 'latency_sum'):
+                    stats[name] += getattr(metrics, name)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                view_name: dict(stats, buckets=list(stats['buckets']))
+                for view_name, stats in self.views.items()
+            }
+
+    def flush(self, force=False):
+        """Копирует счетчики процесса в общий кэш, если пора."""
+        now = time.monotonic()
+        if not force and now - self.flushed_at < METRICS_FLUSH_INTERVAL:
+            return
+        self.flushed_at = now
+        pid = os.getpid()
+        cache.set(METRICS_KEY.format(pid), self.snapshot(), METRICS_TIMEOUT)
+        pids = cache.get(METRICS_PIDS_KEY, set())
+        if pid not in pids:
+            cache.set(METRICS_PIDS_KEY, pids | {pid}, None)
+
+
+registry = Registry()
+
+
+def collect():
+    """Сумма счетчиков всех живых процессов по представлениям."""
+    registry.flush(force=True)
+    pids = cache.get(METRICS_PIDS_KEY, set())
+    snapshots = cache.get_many([METRICS_KEY.format(pid) for pid in pids])
+    alive = {int(key.split(':')[1]) for key in snapshots}
+    if alive != pids:
+        cache.set(METRICS_PIDS_KEY, alive, None)
+    views = {}
+    for snapshot in snapshots.values():
+        for view_name, stats in snapshot.items():
+            merge_stats(views.setdefault(view_name, empty_stats()), stats)
+    return views
+
+
+def format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def render_metrics(views):
+    """Текстовый формат Prometheus."""
+    lines = [
+        f'# HELP {PREFIX}_request_duration_seconds Время ответа, секунды',
+        f'# TYPE {PREFIX}_request_duration_seconds histogram',
+    ]
+    for view_name, stats in sorted(views.items()):
+        label = f'view="{view_name}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, stats['buckets']):
+            cumulative += count
+            lines.append(
+                f'{PREFIX}_request_duration_seconds_bucket'
+                f'{{{label},le="{format_bound(bound)}"}} {cumulative}')
+        lines.append(
+            f'{PREFIX}_request_duration_seconds_sum{{{label}}} '
+            f'{stats["latency_sum"]}')
+        lines.append(
+            f'{PREFIX}_request_duration_seconds_count{{{label}}} '
+            f'{stats["requests"]}')
+    for name, help_text in COUNTERS.items():
+        if name in ('requests', 'latency_sum'):
+            continue
+        lines.append(f'# HELP {PREFIX}_{name}_total {help_text}')
+        lines.append(f'# TYPE {PREFIX}_{name}_total counter')
+        for view_name, stats in sorted(views.items()):
+            lines.append(
+                f'{PREFIX}_{name}_total{{view="{view_name}"}} {stats[name]}')
+    lines.append(f'# HELP {PREFIX}_cache_hit_ratio Доля попаданий в кэш')
+    lines.append(f'# TYPE {PREFIX}_cache_hit_ratio gauge')
+    for view_name, stats in sorted(views.items()):
+        lookups = stats['cache_hits'] + stats['cache_misses']
+        if lookups:
+            lines.append(
+                f'{PREFIX}_cache_hit_ratio{{view="{view_name}"}} '
+                f'{stats["cache_hits"] / lookups}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(self.time_query))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        latency = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        registry.observe(
+            match.view_name if match is not None else UNRESOLVED,
+            latency, metrics)
+        registry.flush()
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(metrics, latency)
+        return response
+
+    @staticmethod
+    def time_query(execute, sql, params, many, context):
+        metrics = current.get()
+        if metrics is not None:
+            metrics.db_queries += 1
+        with timing('db_seconds'):
+            return execute(sql, params, many, context)
+
+
+def server_timing(metrics, latency):
+    """Значение заголовка Server-Timing, длительности в миллисекундах."""
+    parts = []
+    spent = 0.0
+    for name, field in TIMING_FIELDS:
+        seconds = getattr(metrics, field)
+        spent += seconds
+        parts.append(f'{name};dur={seconds * 1000:.2f}')
+    parts[0] += f';desc="{metrics.db_queries} queries"'
+    parts[1] += (f';desc="hits={metrics.cache_hits} '
+                 f'misses={metrics.cache_misses}"')
+    parts.append(f'view;dur={max(latency - spent, 0) * 1000:.2f}')
+    parts.append(f'total;dur={latency * 1000:.2f}')
+    return ', '.join(parts)
@@ -19,3 +19,17 @@ class CreatedModel(models.Model):
     class Meta:
         abstract = True
         default_related_name = 'posts'
+
+
+class StoredFile(models.Model):
+    """Число ссылок на файл в ContentAddressedStorage."""
+
+    name = models.CharField('Имя файла', max_length=255, unique=True)
+    refs = models.PositiveIntegerField('Число ссылок', default=1)
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,61 @@
+"""Бюджет SQL-запросов представления.
+
+@query_budget(n) ограничивает число запросов, которые выполняет
+представление, включая загрузку сессии и пользователя. Поведение задает
+settings.QUERY_BUDGETS: 'off' - не считать, 'log' - писать в лог
+превышение вместе с запросами и местом, откуда они выполнены, 'raise' -
+падать с QueryBudgetExceeded, как в тестах.
+"""
+import logging
+import traceback
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+STACK_LIMIT = 8
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def format_queries(queries):
+    return '\n\n'.join(
+        f'{number}. {sql}\n{"".join(stack)}'
+        for number, (sql, stack) in enumerate(queries, 1)
+    )
+
+
+def query_budget(max_queries):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if settings.QUERY_BUDGETS == 'off':
+                return view(request, *args, **kwargs)
+            queries = []
+
+            def record(execute, sql, params, many, context):
+                # Без двух последних кадров: record и execute_wrapper.
+                stack = traceback.format_stack(limit=STACK_LIMIT + 2)[:-2]
+                queries.append((sql, stack))
+                return execute(sql, params, many, context)
+
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(record))
+                response = view(request, *args, **kwargs)
+            if len(queries) > max_queries:
+                message = '{} выполнило {} SQL-запросов при бюджете {}'.format(
+                    view.__qualname__, len(queries), max_queries)
+                if settings.QUERY_BUDGETS == 'raise':
+                    raise QueryBudgetExceeded(
+                        f'{message}:\n\n{format_queries(queries)}')
+                logger.warning('%s:\n\n%s', message, format_queries(queries))
+            return response
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
@@ -0,0 +1,139 @@
+"""Чтение из реплик базы с гарантией read-your-writes.
+
+ReplicaMiddleware разрешает представлениям из settings.REPLICA_VIEWS читать
+из реплик, ReplicaRouter отправляет туда их запросы к моделям приложений
+settings.REPLICA_APPS, а все записи - в основную базу.
+
+Реплика используется, только если она синхронизирована не раньше, чем
+settings.REPLICA_MAX_LAG секунд назад, и не раньше последней записи самого
+пользователя: время записи хранится в cookie REPLICA_COOKIE. Локально
+реплика - копия файла SQLite, которую обновляет команда sync_replicas.
+"""
+import hashlib
+import random
+import sqlite3
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_SYNCED_KEY = 'replica_synced:{}'
+REPLICA_COOKIE = 'last_write'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+NS_IN_SECOND = 10 ** 9
+
+read_state = ContextVar('read_state', default=None)
+
+
+class ReadState:
+    """Реплики, доступные запросу, и те, из которых он уже читал."""
+
+    def __init__(self, replicas):
+        self.replicas = replicas
+        self.used = set()
+
+    def choose(self):
+        alias = random.choice(list(self.replicas))
+        self.used.add(alias)
+        return alias
+
+    def snapshot(self):
+        """Время синхронизации самой старой из прочитанных реплик."""
+        if not self.used:
+            return None
+        return min(self.replicas[alias] for alias in self.used)
+
+
+def replica_snapshot():
+    state = read_state.get()
+    return state.snapshot() if state is not None else None
+
+
+def synced_key(alias):
+    # Ключ по файлу реплики, а не по псевдониму: у тестовой базы другой
+    # файл, и отметка синхронизации рабочей реплики на неё не действует.
+    name = str(connections[alias].settings_dict['NAME'])
+    return REPLICA_SYNCED_KEY.format(hashlib.md5(name.encode()).hexdigest())
+
+
+def fresh_replicas(last_write=0):
+    """Реплики, синхронизированные после last_write и не позже лага."""
+    keys = {alias: synced_key(alias) for alias in settings.REPLICA_DATABASES}
+    if not keys:
+        return {}
+    synced = cache.get_many(list(keys.values()))
+    oldest = max(time.time_ns() - settings.REPLICA_MAX_LAG * NS_IN_SECOND,
+                 last_write)
+    return {
+        alias: synced[key]
+        for alias, key in keys.items()
+        if synced.get(key, 0) >= oldest
+    }
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = read_state.get()
+        if (state is None or not state.replicas
+                or model._meta.app_label not in settings.REPLICA_APPS):
+            return None
+        return state.choose()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db not in settings.REPLICA_DATABASES
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = read_state.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_state.reset(token)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                REPLICA_COOKIE, str(time.time_ns()),
+                max_age=settings.REPLICA_MAX_LAG, httponly=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method not in SAFE_METHODS
+                or request.resolver_match.view_name
+                not in settings.REPLICA_VIEWS):
+            return None
+        try:
+            last_write = int(request.COOKIES.get(REPLICA_COOKIE, 0))
+        except ValueError:
+            last_write = 0
+        read_state.set(ReadState(fresh_replicas(last_write)))
+        return None
+
+
+def sync_replica(source, target):
+    """Копирует базу source в target через backup API SQLite.
+
+    Копия делается одним шагом: читатели реплики ждут его окончания и
+    видят либо старую, либо новую версию базы целиком.
+    """
+    source_connection = sqlite3.connect(source)
+    target_connection = sqlite3.connect(target)
+    try:
+        source_connection.backup(target_connection)
+    finally:
+        target_connection.close()
+        source_connection.close()
+
+
+def mark_synced(alias, synced_at):
+    cache.set(synced_key(alias), synced_at, None)
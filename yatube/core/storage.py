@@ -0,0 +1,102 @@
+"""Хранилище файлов, адресованных по содержимому.
+
+Имя файла - SHA-256 его байтов, разложенный по вложенным каталогам:
+posts/ab/cd/abcd....jpg. Одинаковые файлы хранятся один раз, а число
+ссылок на каждый файл ведет таблица StoredFile: delete() удаляет файл с
+диска, только когда на него не осталось ссылок.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .models import StoredFile
+
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+CONTENT_NAME = re.compile(
+    r'^(?:.+/)?' + r'[0-9a-f]{2}/' * SHARD_LEVELS + r'[0-9a-f]{64}(?:\.\w+)?$')
+
+
+def content_name(directory, digest, extension):
+    shards = [
+        digest[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH]
+        for level in range(SHARD_LEVELS)
+    ]
+    return '/'.join(filter(None, [directory, *shards, digest + extension]))
+
+
+def is_content_name(name):
+    return bool(CONTENT_NAME.match(name))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # Имя всё равно заменяется хэшем содержимого в _save.
+        return name
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        upload_dir = self.path(directory)
+        os.makedirs(upload_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        # Хэш считается в том же проходе, что и запись: файл читается
+        # один раз, а во временный файл в том же разделе, откуда он
+        # переносится атомарным rename.
+        fd, temporary = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    output.write(chunk)
+            name = content_name(directory, digest.hexdigest(), extension)
+            full_path = self.path(name)
+            # Ссылка берется до проверки файла и первым же запросом пишет в
+            # базу: если delete() уже снимает последнюю ссылку, этот UPDATE
+            # ждет конца его транзакции, а с ней и удаления файла.
+            with transaction.atomic():
+                if not StoredFile.objects.filter(name=name).update(
+                        refs=F('refs') + 1):
+                    _, created = StoredFile.objects.get_or_create(name=name)
+                    if not created:
+                        StoredFile.objects.filter(name=name).update(
+                            refs=F('refs') + 1)
+                if os.path.exists(full_path):
+                    os.remove(temporary)
+                    # Свежая ссылка: сборщик мусора не должен принять файл
+                    # за давно брошенный.
+                    os.utime(full_path)
+                else:
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(temporary, self.file_permissions_mode)
+                    os.replace(temporary, full_path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
+
+    def delete(self, name):
+        """Убирает одну ссылку на файл, сам файл - вместе с последней.
+
+        Файл удаляется в той же транзакции, что и строка StoredFile, а
+        первый запрос транзакции - UPDATE: он блокирует строку (в SQLite -
+        запись в базу), и _save того же содержимого ждет, пока файл не
+        будет удален.
+        """
+        with transaction.atomic():
+            StoredFile.objects.filter(name=name).update(refs=F('refs') - 1)
+            if StoredFile.objects.filter(name=name, refs__gt=0).exists():
+                return
+            StoredFile.objects.filter(name=name).delete()
+            super().delete(name)
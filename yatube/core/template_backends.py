@@ -0,0 +1,24 @@
+from django.template.backends.django import DjangoTemplates, Template
+
+from .metrics import timing
+
+
+class TimedTemplate(Template):
+    @timing('template_seconds')
+    def render(self, context=None, request=None):
+        return super().render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Шаблоны Django, которые отчитываются о времени рендеринга в метрики.
+
+    Засекается рендеринг, вызванный через движок: включенные шаблоны
+    рендерятся внутри него и второй раз не считаются.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
@@ -0,0 +1,52 @@
+"""Тесты с отдельным файлом кэша и без пула воркеров.
+
+Файловый кэш общий для всех процессов развертывания, и cache.clear() в
+тестах стер бы версии страниц, отметки реплик и метрики рабочего сайта.
+Воркеры не видят тестовую базу в памяти, поэтому картинки в тестах
+обрабатываются прямо в процессе, а файлы пишутся во временный MEDIA_ROOT.
+"""
+import copy
+import os
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+@contextmanager
+def isolated_cache():
+    """Подменяет файлы кэшей на временные до выхода из блока."""
+    with tempfile.TemporaryDirectory() as directory:
+        caches = copy.deepcopy(settings.CACHES)
+        for alias, params in caches.items():
+            params['LOCATION'] = os.path.join(directory, f'{alias}.sqlite3')
+        with override_settings(CACHES=caches):
+            yield
+
+
+@contextmanager
+def isolated_media():
+    """Подменяет MEDIA_ROOT временным каталогом до выхода из блока."""
+    with tempfile.TemporaryDirectory() as directory:
+        with override_settings(MEDIA_ROOT=directory):
+            yield
+
+
+def inline_workers():
+    """Задачи пула воркеров выполняются в вызывающем процессе."""
+    return override_settings(THUMBNAIL_WORKERS=0)
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.contexts = ExitStack()
+        self.contexts.enter_context(isolated_cache())
+        self.contexts.enter_context(isolated_media())
+        self.contexts.enter_context(inline_workers())
+
+    def teardown_test_environment(self, **kwargs):
+        self.contexts.close()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,41 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from core.benchmark import compare, percentile, summarize, wsgi_request
+from yatube.wsgi import application
+
+
+class BenchmarkTests(TestCase):
+    def test_percentile(self):
+        """Перцентиль считается по ближайшему рангу."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+
+    def test_compare_matches_scenarios(self):
+        """Сравниваются только общие сценарии, изменения в процентах."""
+        result = {'view': 'index', 'depth': 'deep', 'concurrency': 4,
+                  'p50_ms': 5.0, 'p95_ms': 10.0, 'p99_ms': 20.0,
+                  'throughput': 300.0, 'queries_per_request': 0}
+        baseline = [
+            dict(result, p50_ms=10.0, throughput=200.0),
+            dict(result, concurrency=16),
+        ]
+        change, = compare([result, dict(result, view='profile')], baseline)
+        self.assertEqual(change['p50_ms'], -50)
+        self.assertEqual(change['p95_ms'], 0)
+        self.assertEqual(change['throughput'], 50)
+        self.assertIsNone(change['queries_per_request'])
+
+    def test_wsgi_request(self):
+        """Запрос проходит через WSGI-приложение, SQL-запросы считаются."""
+        response = wsgi_request(application, reverse('users:login'))
+        self.assertEqual(response.status, 200)
+        self.assertIn('csrftoken', response.cookies)
+        missing = wsgi_request(application, '/missing-page/')
+        self.assertEqual(missing.status, 404)
+        summary = summarize([response, missing], 1.0)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['throughput'], 2)
+        self.assertGreaterEqual(summary['p99_ms'], summary['p50_ms'])
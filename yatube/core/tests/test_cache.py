@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from core.cache import SQLiteCache, TwoTierCache
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_basic_operations(self):
+        """Основные операции кэша."""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertTrue(self.cache.add('new', 2))
+        self.assertEqual(self.cache.incr('new', 3), 5)
+        self.assertEqual(
+            self.cache.get_many(['key', 'new', 'missing']),
+            {'key': {'value': 1}, 'new': 5})
+        self.cache.delete_many(['key', 'new'])
+        self.assertIsNone(self.cache.get('key'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expired_values_are_missing(self):
+        """Просроченное значение не отдается и не мешает add."""
+        self.cache.set('key', 1, timeout=0)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 2))
+        self.assertEqual(self.cache.get('key'), 2)
+
+    def test_lru_eviction_by_size(self):
+        """При превышении объема вытесняются давно не читанные записи."""
+        cache = SQLiteCache(self.location, {'OPTIONS': {'MAX_BYTES': 3000}})
+        cache.set('old', b'x' * 1000)
+        cache.connection.execute("UPDATE cache SET accessed = 0")
+        cache.set('fresh', b'x' * 1000)
+        cache.set('newest', b'x' * 1000)
+        self.assertIsNone(cache.get('old'))
+        self.assertIsNotNone(cache.get('newest'))
+
+    def test_shared_between_instances(self):
+        """Два процесса с одним файлом видят записи друг друга."""
+        other = TwoTierCache(self.location, {})
+        local = TwoTierCache(self.location, {})
+        other.set('key', 1)
+        self.assertEqual(local.get('key'), 1)
+        other.set('key', 2)
+        self.assertEqual(local.get('key'), 2)
+        other.delete('key')
+        self.assertIsNone(local.get('key'))
+
+    def test_tests_use_own_cache_file(self):
+        """Тесты пишут во временный файл, а не в кэш развертывания."""
+        location = caches['default'].location
+        self.assertFalse(location.startswith(settings.BASE_DIR))
+        self.assertTrue(location.startswith(tempfile.gettempdir()))
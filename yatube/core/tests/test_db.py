@@ -0,0 +1,63 @@
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase
+
+from core.db import check_connections
+
+
+class SQLiteConnectionTests(TestCase):
+    def test_pragmas_applied(self):
+        """Новое соединение получает PRAGMA из настроек."""
+        with connection.cursor() as cursor:
+            for name in ('synchronous', 'cache_size', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {name}')
+                value = cursor.fetchone()[0]
+                with self.subTest(name=name):
+                    expected = settings.SQLITE_PRAGMAS[name]
+                    if name == 'synchronous':
+                        # NORMAL возвращается числом 1.
+                        expected = 1
+                    self.assertEqual(value, expected)
+
+    def check(self, vendor='postgresql', idle_since=0):
+        """check_connections для соединения, которое выглядит сетевым."""
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'in_atomic_block', False), \
+                mock.patch.object(connection, 'vendor', vendor), \
+                mock.patch.object(connection, 'idle_since', idle_since,
+                                  create=True), \
+                mock.patch.dict(connection.settings_dict,
+                                CONN_HEALTH_CHECKS=True), \
+                mock.patch.object(connection, 'close') as close, \
+                mock.patch.object(
+                    connection, 'cursor', side_effect=DatabaseError) as cursor:
+            check_connections()
+        return cursor, close
+
+    def test_broken_connection_closed(self):
+        """Соединение, не ответившее на проверку, закрывается."""
+        _, close = self.check()
+        close.assert_called_once()
+
+    def test_sqlite_and_recent_connections_not_checked(self):
+        """SQLite и недавно работавшие соединения не проверяются."""
+        for options in ({'vendor': 'sqlite'},
+                        {'idle_since': time.monotonic()}):
+            with self.subTest(**options):
+                cursor, close = self.check(**options)
+                cursor.assert_not_called()
+                close.assert_not_called()
+
+    def test_benchmark(self):
+        """Замер выводит пропускную способность обоих профилей."""
+        out = StringIO()
+        call_command(
+            'sqlite_benchmark', threads=2, seconds=0.1, rows=100, stdout=out)
+        output = out.getvalue()
+        self.assertIn('default:', output)
+        self.assertIn('tuned:', output)
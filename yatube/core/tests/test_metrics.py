@@ -0,0 +1,94 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.metrics import (
+    METRICS_KEY, METRICS_PIDS_KEY, collect, empty_stats, registry,
+)
+from posts.models import Post
+
+User = get_user_model()
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='auth')
+        Post.objects.create(author=user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        registry.views.clear()
+        self.client = Client()
+
+    def test_view_metrics_recorded(self):
+        """Запрос учитывается под именем своего представления."""
+        self.client.get(reverse('posts:index'))
+        stats = collect()['posts:index']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(sum(stats['buckets']), 1)
+        self.assertGreater(stats['db_queries'], 0)
+        self.assertGreater(stats['db_seconds'], 0)
+        self.assertGreater(stats['cache_misses'], 0)
+        self.assertGreater(stats['template_seconds'], 0)
+        self.client.get(reverse('posts:index'))
+        again = collect()['posts:index']
+        self.assertGreater(again['cache_hits'], stats['cache_hits'])
+
+    def test_processes_summed(self):
+        """Счетчики других процессов из общего кэша суммируются."""
+        other = empty_stats()
+        other['requests'] = 2
+        cache.set(METRICS_KEY.format(1), {'posts:index': other})
+        cache.set(METRICS_PIDS_KEY, {1})
+        self.client.get(reverse('posts:index'))
+        self.assertEqual(collect()['posts:index']['requests'], 3)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_prometheus_endpoint(self):
+        """/metrics отдает гистограмму и счетчики в формате Prometheus."""
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response, 'yatube_request_duration_seconds_bucket'
+            '{view="posts:index",le="+Inf"} 1')
+        self.assertContains(
+            response, 'yatube_request_duration_seconds_count'
+            '{view="posts:index"} 1')
+        self.assertContains(response, 'yatube_db_queries_total')
+        self.assertContains(response, 'yatube_cache_hit_ratio')
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_endpoint_hidden(self):
+        """С чужого адреса /metrics недоступен."""
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 404)
+
+    def test_endpoint_closed_by_default(self):
+        """Без METRICS_ALLOWED_IPS /metrics закрыт и для локальных адресов."""
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing(self):
+        """Ответ несет Server-Timing с временем по участкам."""
+        response = self.client.get(reverse('posts:index'))
+        timings = dict(
+            part.split(';')[0:2] for part in
+            response['Server-Timing'].split(', '))
+        self.assertEqual(
+            list(timings),
+            ['db', 'cache', 'template', 'thumbnail', 'view', 'total'])
+        durations = {
+            name: float(value.split('=')[1])
+            for name, value in timings.items()
+        }
+        total = durations.pop('total')
+        self.assertGreater(durations['db'], 0)
+        self.assertAlmostEqual(sum(durations.values()), total, delta=0.1)
+        with self.settings(SERVER_TIMING=False):
+            response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.query_budget import QueryBudgetExceeded, query_budget
+
+User = get_user_model()
+
+
+@query_budget(1)
+def two_queries(request):
+    User.objects.count()
+    User.objects.exists()
+    return HttpResponse()
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+
+    @override_settings(QUERY_BUDGETS='raise')
+    def test_raise(self):
+        """В режиме raise превышение бюджета - ошибка с текстом запросов."""
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'COUNT(*)'):
+            two_queries(self.request)
+
+    @override_settings(QUERY_BUDGETS='log')
+    def test_log(self):
+        """В режиме log превышение пишется в лог вместе со стеком."""
+        with self.assertLogs('core.query_budget', 'WARNING') as logs:
+            two_queries(self.request)
+        self.assertIn('2 SQL-запросов при бюджете 1', logs.output[0])
+        self.assertIn('test_query_budget.py', logs.output[0])
+
+    @override_settings(QUERY_BUDGETS='off')
+    def test_off(self):
+        """В режиме off запросы не считаются."""
+        self.assertEqual(two_queries(self.request).status_code, 200)
+        self.assertEqual(two_queries.query_budget, 1)
@@ -0,0 +1,113 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.urls import resolve, reverse
+
+from core.replicas import (
+    REPLICA_COOKIE, ReadState, ReplicaMiddleware, ReplicaRouter, mark_synced,
+    read_state, sync_replica,
+)
+from posts.caching import cache_feed
+from posts.models import Post
+
+router = ReplicaRouter()
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.middleware = ReplicaMiddleware(self.view)
+
+    def view(self, request):
+        self.middleware.process_view(request, None, (), {})
+        return HttpResponse(str(router.db_for_read(Post)))
+
+    def read_from(self, url, **cookies):
+        request = self.factory.get(url)
+        request.COOKIES.update(cookies)
+        request.resolver_match = resolve(url)
+        return self.middleware(request).content.decode()
+
+    def test_read_views_use_replica(self):
+        """Ленты читаются из синхронизированной реплики."""
+        mark_synced('replica', time.time_ns())
+        self.assertEqual(self.read_from(reverse('posts:index')), 'replica')
+        self.assertEqual(
+            self.read_from(reverse('posts:follow_index')), 'None')
+        self.assertIsNone(router.db_for_read(Post))
+
+    def test_lagging_replica_skipped(self):
+        """Отставшая или несинхронизированная реплика не используется."""
+        self.assertEqual(self.read_from(reverse('posts:index')), 'None')
+        with self.settings(REPLICA_MAX_LAG=1):
+            mark_synced('replica', time.time_ns() - 2 * 10 ** 9)
+            self.assertEqual(self.read_from(reverse('posts:index')), 'None')
+
+    def test_read_your_writes(self):
+        """После записи пользователь читает из основной базы, пока реплика
+        не получит его изменения."""
+        mark_synced('replica', time.time_ns())
+        request = self.factory.post('/')
+        response = ReplicaMiddleware(lambda request: HttpResponse())(request)
+        last_write = response.cookies[REPLICA_COOKIE].value
+        url = reverse('posts:index')
+        self.assertEqual(
+            self.read_from(url, **{REPLICA_COOKIE: last_write}), 'None')
+        mark_synced('replica', time.time_ns())
+        self.assertEqual(
+            self.read_from(url, **{REPLICA_COOKIE: last_write}), 'replica')
+
+    def test_writes_and_sessions_use_primary(self):
+        """Записи и сессии всегда идут в основную базу."""
+        token = read_state.set(ReadState({'replica': time.time_ns()}))
+        try:
+            self.assertEqual(router.db_for_write(Post), 'default')
+            self.assertIsNone(router.db_for_read(Session))
+        finally:
+            read_state.reset(token)
+        self.assertFalse(router.allow_migrate('replica', 'posts'))
+
+    def test_stale_replica_page_not_cached(self):
+        """Страницу из реплики старше версий кэша не сохраняют."""
+        calls = []
+
+        @cache_feed(60, 'replica_page', 'replica_test')
+        def view(request):
+            calls.append(router.db_for_read(Post))
+            return HttpResponse()
+
+        token = read_state.set(ReadState({'replica': 1}))
+        try:
+            view(self.factory.get('/'))
+            view(self.factory.get('/'))
+        finally:
+            read_state.reset(token)
+        self.assertEqual(calls, ['replica', 'replica'])
+
+
+class SyncReplicaTests(TestCase):
+    def test_copies_database(self):
+        """Реплика получает содержимое основной базы."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source = os.path.join(directory, 'source.sqlite3')
+        target = os.path.join(directory, 'target.sqlite3')
+        connection = sqlite3.connect(source)
+        connection.execute('CREATE TABLE item (name TEXT)')
+        connection.execute("INSERT INTO item VALUES ('пост')")
+        connection.commit()
+        connection.close()
+        sync_replica(source, target)
+        connection = sqlite3.connect(target)
+        self.assertEqual(
+            connection.execute('SELECT name FROM item').fetchall(),
+            [('пост',)])
+        connection.close()
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from core.models import StoredFile
+from core.storage import ContentAddressedStorage, is_content_name
+
+CONTENT = b'same bytes'
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_name_is_sharded_hash(self):
+        """Имя файла - хэш содержимого во вложенных каталогах."""
+        name = self.storage.save('posts/photo.JPG', ContentFile(CONTENT))
+        self.assertEqual(
+            name, f'posts/{DIGEST[:2]}/{DIGEST[2:4]}/{DIGEST}.jpg')
+        self.assertTrue(is_content_name(name))
+        self.assertFalse(is_content_name('posts/photo.jpg'))
+        with self.storage.open(name) as stored:
+            self.assertEqual(stored.read(), CONTENT)
+
+    def test_duplicates_stored_once(self):
+        """Одинаковые файлы хранятся один раз и удаляются с последней
+        ссылкой."""
+        first = self.storage.save('posts/a.jpg', ContentFile(CONTENT))
+        second = self.storage.save('posts/b.jpg', ContentFile(CONTENT))
+        self.assertEqual(first, second)
+        self.assertEqual(StoredFile.objects.get(name=first).refs, 2)
+        self.storage.delete(first)
+        self.assertTrue(self.storage.exists(first))
+        self.assertEqual(StoredFile.objects.get(name=first).refs, 1)
+        self.storage.delete(first)
+        self.assertFalse(self.storage.exists(first))
+        self.assertFalse(StoredFile.objects.filter(name=first).exists())
+        self.assertEqual(
+            self.storage.listdir(f'posts/{DIGEST[:2]}/{DIGEST[2:4]}')[1], [])
+
+    def test_duplicate_refreshes_mtime(self):
+        """Повторная загрузка обновляет время файла для сборщика мусора."""
+        name = self.storage.save('posts/a.jpg', ContentFile(CONTENT))
+        path = self.storage.path(name)
+        os.utime(path, (0, 0))
+        self.storage.save('posts/b.jpg', ContentFile(CONTENT))
+        self.assertGreater(os.stat(path).st_mtime, time.time() - 60)
+
+
+class ConcurrentReferencesTests(TransactionTestCase):
+    """Порядок шагов, на котором держится защита от гонки delete и save
+    одинакового содержимого: настоящую гонку тестовая база SQLite в
+    памяти не воспроизводит."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.directory)
+        self.name = self.storage.save('posts/a.jpg', ContentFile(CONTENT))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_file_removed_with_last_reference(self):
+        """Файл удаляется в транзакции, которая сняла последнюю ссылку."""
+        states = []
+        unlink = FileSystemStorage.delete
+
+        def delete(storage, name):
+            states.append((
+                connection.in_atomic_block,
+                StoredFile.objects.filter(name=name).exists(),
+            ))
+            unlink(storage, name)
+
+        with mock.patch.object(FileSystemStorage, 'delete', delete):
+            self.storage.delete(self.name)
+        self.assertEqual(states, [(True, False)])
+        self.assertFalse(self.storage.exists(self.name))
+
+    def test_reference_taken_before_file_check(self):
+        """Повторная загрузка берет ссылку до проверки, есть ли файл."""
+        path = self.storage.path(self.name)
+        refs = []
+        exists = os.path.exists
+
+        def check(checked):
+            if checked == path:
+                refs.append(StoredFile.objects.get(name=self.name).refs)
+            return exists(checked)
+
+        with mock.patch('core.storage.os.path.exists', check):
+            self.storage.save('posts/b.jpg', ContentFile(CONTENT))
+        self.assertEqual(refs, [2])
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',
+    b'\x89PNG\r\n\x1a\n',
+    b'GIF87a',
+    b'GIF89a',
+)
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+
+def looks_like_image(header):
+    if header.startswith(IMAGE_SIGNATURES):
+        return True
+    return header[:4] == b'RIFF' and header[8:12] == b'WEBP'
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку на диск кусками, не держа файл в памяти.
+
+    По первому куску проверяет сигнатуру картинки и прекращает запись,
+    если это не картинка или файл больше IMAGE_UPLOAD_MAX_SIZE. Причина
+    остается в upload_error загруженного файла, её показывает форма.
+    Файл на диске форма проверяет по пути, не читая его в память.
+    """
+
+    chunk_size = UPLOAD_CHUNK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file.upload_error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.file.upload_error:
+            return None
+        if start == 0 and not looks_like_image(raw_data):
+            self.file.upload_error = 'invalid_image'
+            return None
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.file.upload_error = 'too_large'
+            return None
+        return super().receive_data_chunk(raw_data, start)
@@ -2,6 +2,7 @@ from django.contrib import admin
 
 
 from .models import Post, Group
+from .search import filter_by_text
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -11,6 +12,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по полнотекстовому индексу вместо LIKE '%...%'."""
+        if not search_term:
+            return queryset, False
+        return filter_by_text(queryset, search_term), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
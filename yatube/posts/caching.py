@@ -0,0 +1,158 @@
+import hashlib
+import math
+import random
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils.cache import (
+    get_cache_key, has_vary_header, learn_cache_key, patch_vary_headers,
+)
+
+from core.replicas import replica_snapshot
+
+NAMESPACE_KEY = 'ns:{}'
+STALE_TIMEOUT = 60 * 60
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 2
+LOCK_POLL = 0.05
+EARLY_EXPIRATION_BETA = 1.0
+
+
+def namespace_key(namespace):
+    return NAMESPACE_KEY.format(hashlib.md5(namespace.encode()).hexdigest())
+
+
+def get_versions(*namespaces):
+    """Текущие версии пространств имен кэша одним запросом к кэшу.
+
+    Версия - момент последнего изменения в наносекундах, поэтому вытесненная
+    из кэша версия создается заново и не совпадает ни с одной старой.
+    """
+    keys = [namespace_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def get_version(namespace):
+    return get_versions(namespace)[0]
+
+
+def bump_versions(*namespaces):
+    """Делает устаревшим всё, что закэшировано в этих пространствах имен."""
+    version = time.time_ns()
+    cache.set_many(
+        {namespace_key(namespace): version
+         for namespace in namespaces},
+        None,
+    )
+
+
+def is_fresh(entry, versions):
+    """Проверяет версию записи и решает, не пора ли обновить её заранее.
+
+    Вероятностное раннее истечение (XFetch): чем ближе срок и чем дольше
+    страница считалась, тем выше шанс, что один из запросов обновит её
+    до того, как она протухнет у всех одновременно.
+    """
+    entry_versions, expires_at, delta = entry[1:4]
+    if entry_versions != versions:
+        return False
+    early = -delta * EARLY_EXPIRATION_BETA * math.log(1 - random.random())
+    return time.time() + early < expires_at
+
+
+def wait_for_entry(request, key_prefix, versions):
+    """Ждет, пока страницу пересчитает запрос, который держит блокировку."""
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+        cache_key = get_cache_key(request, key_prefix, 'GET', cache=cache)
+        entry = cache.get(cache_key) if cache_key else None
+        if entry is not None and entry[1] == versions:
+            return entry[0]
+    return None
+
+
+def render_and_store(view, request, args, kwargs, key_prefix, timeout,
+                     namespaces, versions):
+    started = time.time()
+    response = view(request, *args, **kwargs)
+    if response.status_code != 200 or response.streaming:
+        return response
+    # Страница из реплики, отставшей от версий, устарела уже при рендеринге.
+    snapshot = replica_snapshot()
+    if snapshot is not None and snapshot < max(versions):
+        return response
+    if hasattr(request, 'session') and request.session.accessed:
+        patch_vary_headers(response, ('Cookie',))
+    if (not request.COOKIES and response.cookies
+            and has_vary_header(response, 'Cookie')):
+        return response
+    finished = time.time()
+    cache_key = learn_cache_key(
+        request, response, timeout + STALE_TIMEOUT, key_prefix, cache=cache)
+    cache.set(
+        cache_key,
+        (response, versions, finished + timeout, finished - started,
+         namespaces),
+        timeout + STALE_TIMEOUT,
+    )
+    return response
+
+
+def cache_feed(timeout, key_prefix, *namespace_templates):
+    """Кэширует страницу до истечения timeout или смены версии namespaces.
+
+    Пространства имен - шаблоны строк, которые заполняются аргументами
+    представления и request, либо функции (request, **kwargs) -> str.
+    Функции вызываются только при пересчете страницы: их результат
+    хранится в записи кэша, и попадание в кэш проверяет версии по нему.
+    В отличие от cache_page не выставляет max-age, чтобы браузер не держал
+    устаревшую копию, и сразу добавляет Vary: Cookie, если представление
+    читало сессию, - иначе страница одного пользователя достанется другим.
+
+    Пересчитывает страницу только запрос, захвативший блокировку. Остальные
+    в это время получают устаревшую копию, а если её нет - ждут до
+    LOCK_WAIT секунд готовую страницу.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            cache_key = get_cache_key(request, key_prefix, 'GET', cache=cache)
+            entry = cache.get(cache_key) if cache_key else None
+            # Записи без пространств имен остались от прошлой версии кода.
+            if (entry is not None and len(entry) == 5
+                    and is_fresh(entry, get_versions(*entry[4]))):
+                return entry[0]
+            namespaces = [
+                namespace(request, **kwargs) if callable(namespace)
+                else namespace.format(request=request, **kwargs)
+                for namespace in namespace_templates
+            ]
+            versions = get_versions(*namespaces)
+            lock_key = '{}.lock.{}'.format(key_prefix, hashlib.md5(
+                (cache_key or request.build_absolute_uri()).encode(),
+            ).hexdigest())
+            locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+            if not locked:
+                if entry is not None:
+                    return entry[0]
+                response = wait_for_entry(request, key_prefix, versions)
+                if response is not None:
+                    return response
+            try:
+                return render_and_store(
+                    view, request, args, kwargs, key_prefix, timeout,
+                    namespaces, versions)
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+        return wrapper
+    return decorator
@@ -0,0 +1,151 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import FeedEntry, Follow, Post
+from .utils import CursorPaginator, cursor_slice, encode_cursor
+
+# SQLite собирает вставку bulk_create из UNION ALL, а в нем не больше
+# 500 частей.
+FEED_BATCH_SIZE = 500
+FEED_BACKFILL_LIMIT = 1000
+PULL_AUTHORS_KEY = 'feed_pull_authors'
+PULL_AUTHORS_TIMEOUT = 60 * 10
+# Множество с прошлого пересчета хранится без срока: по нему видно, кто
+# из авторов перестал быть pull-автором.
+PREVIOUS_PULL_AUTHORS_KEY = 'feed_pull_authors:previous'
+
+
+def get_pull_authors():
+    """Авторы, чьи посты не раскладываются по лентам, а читаются на лету.
+
+    Это авторы, у которых не меньше settings.FEED_PULL_FOLLOWERS
+    подписчиков: запись в каждую ленту стоила бы слишком дорого. Пока
+    автор в этом множестве, его посты не попадают в FeedEntry, поэтому
+    выбывшим авторам ленты подписчиков догружаются при пересчете.
+    """
+    authors = cache.get(PULL_AUTHORS_KEY)
+    if authors is None:
+        authors = set(
+            Follow.objects.values('author_id').annotate(
+                followers=Count('id'),
+            ).filter(
+                followers__gte=settings.FEED_PULL_FOLLOWERS,
+            ).values_list('author_id', flat=True)
+        )
+        for author_id in cache.get(PREVIOUS_PULL_AUTHORS_KEY, set()) - authors:
+            backfill_author(author_id)
+        cache.set(PREVIOUS_PULL_AUTHORS_KEY, authors, None)
+        cache.set(PULL_AUTHORS_KEY, authors, PULL_AUTHORS_TIMEOUT)
+    return authors
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора."""
+    if post.author_id in get_pull_authors():
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, author_id=post.author_id,
+                   post_id=post.id, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def add_author_to_feed(user_id, author_id):
+    """Добавляет в ленту последние FEED_BACKFILL_LIMIT постов автора."""
+    if author_id in get_pull_authors():
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date')[:FEED_BACKFILL_LIMIT]
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, author_id=author_id,
+                   post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_author(author_id):
+    """Добавляет последние FEED_BACKFILL_LIMIT постов автора в ленты всех
+    его подписчиков."""
+    posts = list(Post.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date')[:FEED_BACKFILL_LIMIT])
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, author_id=author_id,
+                   post_id=post_id, pub_date=pub_date)
+         for user_id in followers.iterator()
+         for post_id, pub_date in posts),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def remove_author_from_feed(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild_feed(user_id):
+    FeedEntry.objects.filter(user_id=user_id).delete()
+    authors = Follow.objects.filter(
+        user_id=user_id).values_list('author_id', flat=True)
+    for author_id in authors:
+        add_author_to_feed(user_id, author_id)
+
+
+def post_key(post):
+    return post.pub_date, post.id
+
+
+class FollowFeedPaginator(CursorPaginator):
+    """Лента подписок: записи FeedEntry плюс посты pull-авторов.
+
+    Каждая страница - k-путевое слияние уже отсортированных срезов:
+    одного по ленте пользователя и по одному на каждого pull-автора.
+    Записи pull-авторов в FeedEntry пропускаются, чтобы не было дублей.
+    Номеров страниц нет, как у SearchPaginator: страница N с номером
+    читала бы N страниц из каждого источника, get_page всегда отдает
+    первую страницу.
+    """
+    cursor_id_field = 'post_id'
+
+    def __init__(self, user, per_page, **kwargs):
+        pull_authors = list(Follow.objects.filter(
+            user=user, author_id__in=get_pull_authors(),
+        ).values_list('author_id', flat=True))
+        self.pull_querysets = [
+            Post.objects.filter(author_id=author_id).select_related(
+                'author', 'group')
+            for author_id in pull_authors
+        ]
+        entries = user.feed_entries.exclude(
+            author_id__in=pull_authors,
+        ).select_related('post__author', 'post__group')
+        super().__init__(entries, per_page, **kwargs)
+
+    def get_page(self, number):
+        return self.get_first_cursor_page()
+
+    def _fetch(self, key, backward, limit):
+        sources = [[
+            entry.post for entry in cursor_slice(
+                self.object_list, key, backward, limit, self.cursor_id_field)
+        ]]
+        sources += [
+            cursor_slice(queryset, key, backward, limit)
+            for queryset in self.pull_querysets
+        ]
+        merged = heapq.merge(*sources, key=post_key, reverse=not backward)
+        return list(islice(merged, limit))
+
+    def _encode(self, obj):
+        return encode_cursor(post_key(obj))
@@ -1,8 +1,15 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
 from .models import Post, Comment
 
 User = get_user_model()
+UPLOAD_ERRORS = {
+    'invalid_image': 'Загрузите правильное изображение.',
+    'too_large': 'Картинка больше {}.',
+}
 
 
 class PostForm(forms.ModelForm):
@@ -10,6 +17,41 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if hasattr(image, 'image'):
+            width, height = image.image.size
+            if width * height > Image.MAX_IMAGE_PIXELS:
+                raise forms.ValidationError(
+                    'Картинка слишком большая по размерам.',
+                    code='too_many_pixels',
+                )
+        return image
+
+    def clean(self):
+        # Файл, запись которого ImageUploadHandler прекратил, обрезан, и
+        # ImageField уже отверг его как неправильное изображение: вместо
+        # этой ошибки показывается настоящая причина.
+        upload = self.files.get(self.add_prefix('image'))
+        error = getattr(upload, 'upload_error', None)
+        if error:
+            self.errors.pop('image', None)
+            self.add_error('image', forms.ValidationError(
+                UPLOAD_ERRORS[error].format(
+                    filesizeformat(settings.IMAGE_UPLOAD_MAX_SIZE)),
+                code=error,
+            ))
+        return super().clean()
+
+    def save(self, commit=True):
+        if 'image' in self.changed_data:
+            image = self.cleaned_data['image']
+            if image:
+                self.instance.width, self.instance.height = image.image.size
+            else:
+                self.instance.width = self.instance.height = None
+        return super().save(commit)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,89 @@
+"""Обработка загруженных картинок постов вне запроса.
+
+Воркер уменьшает картинку до MAX_IMAGE_SIDE, поворачивает её по EXIF и
+сохраняет прогрессивным JPEG без метаданных, а затем создает миниатюры.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import Post, image_storage
+from .thumbnails import generate_thumbnails
+from .workers import submit
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_SIDE = 2048
+JPEG_QUALITY = 85
+BACKGROUND = (255, 255, 255)
+UPLOAD_TO = Post._meta.get_field('image').upload_to
+
+
+def flatten(image):
+    """RGB-копия картинки, прозрачные места залиты BACKGROUND."""
+    if image.mode == 'P':
+        image = image.convert('RGBA')
+    if image.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', image.size, BACKGROUND)
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def normalize_image(name):
+    """Сохраняет уменьшенную копию картинки, возвращает (имя, ширина, высота).
+
+    Для JPEG draft() декодирует картинку сразу в уменьшенном масштабе,
+    поэтому большая фотография не разворачивается в память целиком.
+    """
+    with image_storage.open(name) as source:
+        image = Image.open(source)
+        image.draft('RGB', (MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.LANCZOS)
+        image = flatten(image)
+    buffer = BytesIO()
+    image.save(
+        buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    new_name = image_storage.save(
+        os.path.join(UPLOAD_TO, 'image.jpg'), ContentFile(buffer.getvalue()))
+    return new_name, image.width, image.height
+
+
+def process_post_image(post_id, name):
+    """Заменяет картинку поста обработанной копией и создает миниатюры."""
+    try:
+        new_name, width, height = normalize_image(name)
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', name)
+        return False
+    post = Post.objects.filter(pk=post_id, image=name).first()
+    if post is None:
+        # Пока шла обработка, пост удалили или картинку заменили.
+        image_storage.delete(new_name)
+        return False
+    # Миниатюры создаются до сохранения поста: save меняет updated, и
+    # карточки, закэшированные с новым ключом, уже ссылаются на готовые
+    # файлы, а не на представление post_thumbnail.
+    generate_thumbnails(new_name)
+    post.image.name = new_name
+    post.width = width
+    post.height = height
+    post.save(update_fields=('image', 'width', 'height', 'updated'))
+    if new_name == name:
+        # Картинка уже была обработана: save добавил лишнюю ссылку, а
+        # сигнал снимает ссылку только с замененного файла.
+        image_storage.delete(new_name)
+    return True
+
+
+def queue_image_processing(post):
+    """Ставит обработку картинки поста в очередь после коммита."""
+    if post.image:
+        post_id, name = post.pk, post.image.name
+        transaction.on_commit(
+            lambda: submit(process_post_image, post_id, name))
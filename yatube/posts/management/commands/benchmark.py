@@ -0,0 +1,212 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from core.benchmark import (
+    PERCENTILES, compare, environment, load_results, run_load, save_report,
+    wsgi_request,
+)
+from posts.feed import rebuild_feed
+from posts.models import Follow, Group, Post
+from posts.seeding import SEED_PASSWORD
+from posts.utils import CURSOR_LAST
+
+User = get_user_model()
+
+READ_VIEWS = ('index', 'group_posts', 'profile', 'post_detail', 'follow_index')
+WRITE_VIEWS = ('post_create', 'add_comment')
+DEPTHS = ('shallow', 'deep')
+# Сколько групп, авторов и постов перебирают сценарии: у данных seed самые
+# популярные из них идут первыми.
+TARGETS = 50
+
+
+class Scenarios:
+    """Пути запросов к представлениям на заполненной базе."""
+
+    def __init__(self, deep_page):
+        self.deep_page = deep_page
+        self.groups = list(Group.objects.order_by('id').values_list(
+            'slug', flat=True)[:TARGETS])
+        self.authors = list(User.objects.order_by('id').values_list(
+            'username', flat=True)[:TARGETS])
+        # Свежие посты: у них больше всего комментариев.
+        self.posts = list(Post.objects.order_by('-pub_date', '-id')
+                          .values_list('id', flat=True)[:TARGETS])
+        if not self.authors or not self.posts:
+            raise CommandError(
+                'База пуста: сначала заполните её командой seed.')
+        # Обычный пользователь с подписками: у самых первых авторов seed
+        # тысячи подписчиков, и их посты замеряли бы рассылку по лентам.
+        self.follower = User.objects.filter(
+            id=Follow.objects.order_by('-user_id').values('user_id')[:1]
+        ).first() or User.objects.order_by('-id').first()
+        # seed собирает ленты только первым пользователям, а без ленты
+        # follow_index замерял бы пустую страницу.
+        rebuild_feed(self.follower.id)
+
+    def page(self, depth):
+        return f'?page={self.deep_page if depth == "deep" else 1}'
+
+    def feed_page(self, depth):
+        # Лента подписок листается только курсором: номера страниц нет.
+        return f'?before={CURSOR_LAST}' if depth == 'deep' else ''
+
+    def request(self, view, depth, number):
+        """Путь, метод и данные формы number-го запроса сценария."""
+        if view == 'index':
+            return reverse('posts:index') + self.page(depth), 'GET', None
+        if view == 'group_posts':
+            if not self.groups:
+                raise CommandError('В базе нет групп.')
+            slug = self.groups[number % len(self.groups)]
+            return (reverse('posts:group_list', args=(slug,))
+                    + self.page(depth), 'GET', None)
+        if view == 'profile':
+            username = self.authors[number % len(self.authors)]
+            return (reverse('posts:profile', args=(username,))
+                    + self.page(depth), 'GET', None)
+        post_id = self.posts[number % len(self.posts)]
+        if view == 'post_detail':
+            return (reverse('posts:post_detail', args=(post_id,))
+                    + self.page(depth), 'GET', None)
+        if view == 'follow_index':
+            return (reverse('posts:follow_index') + self.feed_page(depth),
+                    'GET', None)
+        if view == 'post_create':
+            return reverse('posts:post_create'), 'POST', {
+                'text': f'Пост нагрузочного теста {number}'}
+        return reverse('posts:add_comment', args=(post_id,)), 'POST', {
+            'text': f'Комментарий нагрузочного теста {number}'}
+
+
+def login(application, user, password):
+    """Входит через форму входа, возвращает cookie сессии и CSRF."""
+    login_url = reverse('users:login')
+    cookies = wsgi_request(application, login_url).cookies
+    token = cookies.get(settings.CSRF_COOKIE_NAME)
+    response = wsgi_request(
+        application, login_url, 'POST', cookies=cookies, data={
+            'username': user.username, 'password': password,
+            'csrfmiddlewaretoken': token})
+    cookies.update(response.cookies)
+    if settings.SESSION_COOKIE_NAME not in cookies:
+        raise CommandError(
+            f'Не удалось войти как {user.username}: проверьте --password.')
+    return cookies
+
+
+def parse_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время ответа представлений через WSGI-приложение на '
+            'заполненной базе: p50/p95/p99, пропускную способность и число '
+            'SQL-запросов на разных уровнях конкурентности. Перед каждым '
+            'сценарием кэш очищается. Сценарии записи добавляют в базу посты '
+            'и комментарии.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--views', type=parse_list,
+            default=list(READ_VIEWS + WRITE_VIEWS),
+            help='Представления через запятую.',
+        )
+        parser.add_argument(
+            '--concurrency', type=lambda value: [
+                int(level) for level in parse_list(value)],
+            default=[1, 4, 16],
+            help='Уровни конкурентности через запятую.',
+        )
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument(
+            '--warmup', type=int, default=20,
+            help='Запросов до замера в каждом сценарии.',
+        )
+        parser.add_argument(
+            '--deep-page', type=int, default=1000,
+            help='Номер страницы для глубоких сценариев.',
+        )
+        parser.add_argument('--password', default=SEED_PASSWORD)
+        parser.add_argument(
+            '--output', default='benchmark.json',
+            help='Куда сохранить результаты в JSON.',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON прошлого замера для сравнения.',
+        )
+
+    def handle(self, *args, views, concurrency, requests, warmup, deep_page,
+               password, output, baseline, **options):
+        unknown = set(views) - set(READ_VIEWS + WRITE_VIEWS)
+        if unknown:
+            raise CommandError(
+                'Неизвестные представления: ' + ', '.join(sorted(unknown)))
+        if requests < 1 or not concurrency or min(concurrency) < 1:
+            raise CommandError(
+                'Нужен хотя бы один запрос и один поток на уровень.')
+        if settings.DEBUG:
+            self.stderr.write(
+                'DEBUG включен: запросы к базе записываются в память, '
+                'результаты не соответствуют боевому режиму.')
+        from yatube.wsgi import application
+
+        scenarios = Scenarios(deep_page)
+        cookies = login(application, scenarios.follower, password)
+        headers = {'X-CSRFToken': cookies.get(settings.CSRF_COOKIE_NAME, '')}
+        results = []
+        # Записи идут последними: они сбрасывают кэш страниц чтения.
+        for view in [view for view in READ_VIEWS + WRITE_VIEWS
+                     if view in views]:
+            for depth in DEPTHS if view in READ_VIEWS else (None,):
+                for level in concurrency:
+                    # Каждый сценарий начинает с одинакового холодного кэша.
+                    cache.clear()
+
+                    def send(number, view=view, depth=depth):
+                        path, method, data = scenarios.request(
+                            view, depth, number)
+                        return wsgi_request(
+                            application, path, method, data, cookies,
+                            headers)
+
+                    result = dict(
+                        view=view, depth=depth, concurrency=level,
+                        **run_load(send, requests, level, warmup))
+                    results.append(result)
+                    self.stdout.write(self.format_result(result))
+        save_report(output, results, dict(
+            environment(), requests=requests, warmup=warmup,
+            deep_page=deep_page))
+        self.stdout.write(f'Результаты сохранены в {output}')
+        if baseline:
+            self.stdout.write(f'Изменения относительно {baseline}:')
+            for change in compare(results, load_results(baseline)):
+                self.stdout.write(self.format_change(change))
+
+    @staticmethod
+    def scenario(result):
+        return '{} {} x{}'.format(
+            result['view'], result['depth'] or '-', result['concurrency'])
+
+    def format_result(self, result):
+        latencies = ', '.join(
+            f'p{share} {result[f"p{share}_ms"]:.1f} мс'
+            for share in PERCENTILES)
+        return (f'{self.scenario(result)}: {latencies}, '
+                f'{result["throughput"]:.0f} запр/с, '
+                f'{result["queries_per_request"]:.1f} SQL/запр, '
+                f'ошибок {result["errors"]}')
+
+    def format_change(self, change):
+        fields = [f'p{share}_ms' for share in PERCENTILES] + [
+            'throughput', 'queries_per_request']
+        parts = ', '.join(
+            '{} {}'.format(field, '-' if change[field] is None
+                           else f'{change[field]:+.1f}%')
+            for field in fields)
+        return f'{self.scenario(change)}: {parts}'
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from posts.media_gc import AREAS, collect_area
+
+MAX_FILES = 10000
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки без постов и неиспользуемые миниатюры. '
+            'Каждый запуск продолжает обход с места предыдущего.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--area', choices=sorted(AREAS), action='append',
+            help='Что обходить; по умолчанию всё.',
+        )
+        parser.add_argument(
+            '--max-files', type=int, default=MAX_FILES,
+            help='Сколько файлов просмотреть за запуск в каждой области.',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Пауза в секундах между пачками, чтобы не нагружать диск.',
+        )
+
+    def handle(self, *args, area, max_files, pause, **options):
+        for name in area or sorted(AREAS):
+            scanned, collected, finished = collect_area(
+                name, max_files, pause)
+            self.stdout.write(
+                f'{name}: просмотрено {scanned}, удалено {collected}'
+                + ('' if finished else ', обход продолжится'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from core.storage import is_content_name
+from posts.models import Post, image_storage
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в хранилище, адресованное '
+            'по содержимому.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, batch_size, **options):
+        moved = missing = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                Post.objects.exclude(image='').filter(pk__gt=last_pk)
+                .select_related('author', 'group').order_by('pk')
+                [:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            for post in batch:
+                name = post.image.name
+                if is_content_name(name):
+                    continue
+                if not image_storage.exists(name):
+                    missing += 1
+                    continue
+                with image_storage.open(name) as source:
+                    post.image.name = image_storage.save(name, source)
+                post.save(update_fields=('image', 'updated'))
+                if not Post.objects.filter(image=name).exists():
+                    image_storage.delete(name)
+                moved += 1
+        self.stdout.write(
+            f'Перенесено картинок: {moved}, файлов не найдено: {missing}')
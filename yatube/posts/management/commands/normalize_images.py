@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.images import process_post_image
+from posts.models import Post
+from posts.workers import make_executor
+
+CHUNK_SIZE = 20
+
+
+class Command(BaseCommand):
+    help = ('Обрабатывает картинки постов, загруженные до появления '
+            'обработки: уменьшает, убирает EXIF, записывает размеры.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS,
+            help='Число процессов; 0 - без отдельных процессов.',
+        )
+
+    def handle(self, *args, workers, **options):
+        posts = list(Post.objects.exclude(image='').filter(
+            width__isnull=True).values_list('pk', 'image'))
+        if workers and posts:
+            with make_executor(workers) as executor:
+                results = list(executor.map(
+                    process_post_image, *zip(*posts), chunksize=CHUNK_SIZE))
+        else:
+            results = [process_post_image(*post) for post in posts]
+        self.stdout.write(
+            f'Обработано картинок: {results.count(True)}, '
+            f'с ошибками: {results.count(False)}')
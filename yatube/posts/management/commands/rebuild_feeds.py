@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.feed import rebuild_feed
+from posts.models import FeedEntry, Follow
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Заполняет ленты подписок по существующим записям Follow.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', dest='username',
+            help='Пересобрать ленту только этого пользователя.',
+        )
+
+    def handle(self, *args, username=None, **options):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'Пользователь {username} не найден.')
+            rebuild_feed(user.id)
+            self.stdout.write('Пересобрано лент: 1')
+            return
+        FeedEntry.objects.exclude(
+            user_id__in=Follow.objects.values('user_id')).delete()
+        user_ids = Follow.objects.order_by('user_id').values_list(
+            'user_id', flat=True).distinct()
+        rebuilt = 0
+        for user_id in user_ids.iterator():
+            rebuild_feed(user_id)
+            rebuilt += 1
+        self.stdout.write(f'Пересобрано лент: {rebuilt}')
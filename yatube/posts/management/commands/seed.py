@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.seeding import SEED_EPOCH, SEED_PASSWORD, Seeder
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу большим объемом правдоподобных данных для '
+            f'нагрузочных тестов. Пароль пользователей - {SEED_PASSWORD}.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=200000)
+        parser.add_argument('--posts', type=int, default=5000000)
+        parser.add_argument('--comments', type=int, default=2000000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument(
+            '--follows', type=float, default=20,
+            help='Среднее число подписок пользователя.',
+        )
+        parser.add_argument(
+            '--feeds', type=int, default=100,
+            help='Скольким первым пользователям собрать ленты подписок.',
+        )
+        parser.add_argument(
+            '--days', type=int, default=3 * 365,
+            help='За сколько последних дней распределить посты.',
+        )
+        parser.add_argument(
+            '--now', type=datetime.fromisoformat, default=SEED_EPOCH,
+            help='Дата самых свежих данных в ISO 8601, по умолчанию '
+                 f'{SEED_EPOCH:%Y-%m-%d}.',
+        )
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, seed, users, posts, comments, groups, follows,
+               feeds, days, now, batch_size, **options):
+        if users < 1 and posts + comments > 0:
+            raise CommandError('Для постов и комментариев нужны пользователи.')
+        seeder = Seeder(seed, batch_size, days, log=self.stdout.write, now=now)
+        seeder.run(groups, users, follows, posts, comments, feeds)
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails
+from posts.workers import make_executor
+
+CHUNK_SIZE = 20
+
+
+class Command(BaseCommand):
+    help = 'Создает миниатюры для картинок всех существующих постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS,
+            help='Число процессов; 0 - без отдельных процессов.',
+        )
+
+    def handle(self, *args, workers, **options):
+        names = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True).distinct().iterator()
+        if workers:
+            with make_executor(workers) as executor:
+                results = list(
+                    executor.map(generate_thumbnails, names,
+                                 chunksize=CHUNK_SIZE))
+        else:
+            results = [generate_thumbnails(name) for name in names]
+        self.stdout.write(
+            f'Обработано картинок: {results.count(True)}, '
+            f'с ошибками: {results.count(False)}')
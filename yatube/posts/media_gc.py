@@ -0,0 +1,133 @@
+"""Сборка мусора в MEDIA_ROOT: картинки без постов и старые миниатюры.
+
+Обход идет по файлам в порядке сортировки путей и запоминает в кэше
+последний обработанный путь, поэтому каждый запуск просматривает не больше
+max_files файлов и продолжает с места, где остановился предыдущий.
+"""
+import os
+import time
+
+from django.core.cache import cache
+from sorl.thumbnail import default, delete as delete_with_thumbnails
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from core.models import StoredFile
+from .images import UPLOAD_TO
+from .models import Post, image_storage
+from .thumbnails import THUMBNAIL_MAX_IDLE, THUMBNAIL_USED_KEY
+
+GC_CURSOR_KEY = 'media_gc:{}'
+GC_BATCH_SIZE = 500
+# Файл моложе часа может принадлежать посту, который ещё не сохранен.
+GC_MIN_AGE = 60 * 60
+TEMPORARY_SUFFIX = '.part'
+
+
+def iter_files(root, start_after=()):
+    """Файлы под root в порядке путей, строго после пути start_after.
+
+    Путь - кортеж частей, каталоги целиком до start_after не читаются.
+    """
+    def walk(directory, parts):
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            path = parts + (entry.name,)
+            if entry.is_dir(follow_symlinks=False):
+                if path >= start_after[:len(path)]:
+                    yield from walk(entry.path, path)
+            elif path > start_after:
+                yield path, entry
+    yield from walk(root, ())
+
+
+def collect_originals(batch, now):
+    """Удаляет картинки, на которые не ссылается ни один пост."""
+    names = {}
+    for path, entry in batch:
+        if now - entry.stat().st_mtime >= GC_MIN_AGE:
+            names[UPLOAD_TO + '/'.join(path)] = entry
+    referenced = set(Post.objects.filter(
+        image__in=list(names)).values_list('image', flat=True))
+    garbage = [name for name in names if name not in referenced]
+    StoredFile.objects.filter(name__in=garbage).delete()
+    for name in garbage:
+        if name.endswith(TEMPORARY_SUFFIX):
+            image_storage.delete(name)
+        else:
+            delete_with_thumbnails(ImageFile(name, image_storage))
+    return len(garbage)
+
+
+def collect_thumbnails(batch, now):
+    """Удаляет миниатюры, о которых не знает sorl-thumbnail, и те, на
+    которые давно не ссылалась ни одна страница (mark_thumbnails_used)."""
+    thumbnails = {
+        ImageFile(sorl_settings.THUMBNAIL_PREFIX + '/'.join(path),
+                  default.storage): entry
+        for path, entry in batch
+    }
+    keys = {add_prefix(thumbnail.key): thumbnail for thumbnail in thumbnails}
+    registered = set(KVStore.objects.filter(
+        key__in=list(keys)).values_list('key', flat=True))
+    used = cache.get_many([
+        THUMBNAIL_USED_KEY.format(thumbnail.key) for thumbnail in thumbnails])
+    collected = 0
+    for key, thumbnail in keys.items():
+        stat = thumbnails[thumbnail].stat()
+        used_key = THUMBNAIL_USED_KEY.format(thumbnail.key)
+        if key not in registered:
+            if now - stat.st_mtime < GC_MIN_AGE:
+                continue
+        elif now - max(used.get(used_key, 0), stat.st_mtime) < (
+                THUMBNAIL_MAX_IDLE):
+            continue
+        else:
+            # Сначала запись sorl-thumbnail, потом файл: иначе страницы
+            # получали бы адрес уже удаленной миниатюры.
+            default.kvstore.delete(thumbnail, delete_thumbnails=False)
+            cache.delete(used_key)
+        thumbnail.delete()
+        collected += 1
+    return collected
+
+
+AREAS = {
+    'originals': (lambda: image_storage.path(UPLOAD_TO), collect_originals),
+    'thumbnails': (
+        lambda: default.storage.path(sorl_settings.THUMBNAIL_PREFIX),
+        collect_thumbnails,
+    ),
+}
+
+
+def collect_area(area, max_files, pause=0):
+    """Просматривает до max_files файлов области, возвращает
+    (просмотрено, удалено, обход завершен)."""
+    root, collect = AREAS[area]
+    cursor_key = GC_CURSOR_KEY.format(area)
+    cursor = tuple(cache.get(cursor_key) or ())
+    scanned = collected = 0
+    batch = []
+    finished = True
+    for path, entry in iter_files(root(), cursor):
+        batch.append((path, entry))
+        scanned += 1
+        if len(batch) == GC_BATCH_SIZE or scanned == max_files:
+            collected += collect(batch, time.time())
+            cache.set(cursor_key, list(path), None)
+            batch = []
+            if scanned == max_files:
+                finished = False
+                break
+            time.sleep(pause)
+    if batch:
+        collected += collect(batch, time.time())
+    if finished:
+        cache.delete(cursor_key)
+    return scanned, collected, finished
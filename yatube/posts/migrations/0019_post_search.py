@@ -0,0 +1,65 @@
+from django.db import migrations, transaction
+
+BACKFILL_BATCH = 1000
+
+CREATE_SQL = [
+    "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+    "text, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post BEGIN"
+    " INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text);"
+    " END",
+    "CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post BEGIN"
+    " DELETE FROM posts_post_fts WHERE rowid = old.id;"
+    " END",
+    "CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text ON posts_post"
+    " BEGIN"
+    " DELETE FROM posts_post_fts WHERE rowid = old.id;"
+    " INSERT INTO posts_post_fts (rowid, text) VALUES (new.id, new.text);"
+    " END",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS posts_post_fts_update',
+    'DROP TRIGGER IF EXISTS posts_post_fts_delete',
+    'DROP TRIGGER IF EXISTS posts_post_fts_insert',
+    'DROP TABLE IF EXISTS posts_post_fts',
+]
+
+
+def backfill(apps, schema_editor):
+    """Переносит тексты существующих постов в индекс пачками по id.
+
+    Каждая пачка - отдельная транзакция, поэтому база не блокируется на
+    всё время переноса, а новые посты тем временем добавляют триггеры.
+    """
+    connection = schema_editor.connection
+    last_id = 0
+    while True:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT id FROM posts_post WHERE id > %s'
+                    ' ORDER BY id LIMIT %s', [last_id, BACKFILL_BATCH])
+                ids = [row[0] for row in cursor.fetchall()]
+                if not ids:
+                    return
+                cursor.execute(
+                    'INSERT INTO posts_post_fts (rowid, text)'
+                    ' SELECT id, text FROM posts_post'
+                    ' WHERE id BETWEEN %s AND %s AND id NOT IN'
+                    ' (SELECT rowid FROM posts_post_fts)',
+                    [ids[0], ids[-1]])
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('posts', '0018_post_image_storage'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SQL, DROP_SQL),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,12 @@
 from django.db import models
 from core.models import CreatedModel
+from core.storage import ContentAddressedStorage
 from django.db.models import UniqueConstraint
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 TEXT_LIMIT = 15
+image_storage = ContentAddressedStorage()
 
 
 class Group(models.Model):
@@ -34,15 +36,33 @@ class Post(CreatedModel):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=image_storage,
         blank=True,
         help_text='Ваша картинка',
     )
+    width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True, editable=False)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
 
     class Meta:
         ordering = ['-pub_date']
         default_related_name = 'posts'
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Лента сортируется по (-pub_date, -id). В SQLite id - это rowid,
+        # который и так хранится в конце каждого индекса, а обратный проход
+        # по возрастающему индексу дает оба столбца по убыванию. С индексом
+        # по -pub_date rowid остался бы возрастающим и понадобилась бы
+        # сортировка.
+        indexes = [
+            models.Index(
+                fields=['group', 'pub_date'], name='post_group_pub_date_idx'),
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='post_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:TEXT_LIMIT]
@@ -63,6 +83,11 @@ class Comment(CreatedModel):
         default_related_name = 'comments'
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', 'pub_date'],
+                name='comment_post_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:TEXT_LIMIT]
@@ -84,3 +109,38 @@ class Follow(models.Model):
         constraints = [
             UniqueConstraint(fields=['user', 'author'], name='unique_follow')
         ]
+        # Индекс (user, author) создает ограничение unique_follow.
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'),
+        ]
+
+
+class FeedEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['user', 'post'], name='unique_feed_entry')
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_post_idx'),
+        ]
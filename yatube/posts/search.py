@@ -0,0 +1,114 @@
+"""Полнотекстовый поиск по постам через SQLite FTS5.
+
+Таблица posts_post_fts хранит текст постов и обновляется триггерами на
+posts_post (миграция 0019), поэтому её не обходят ни queryset.update(),
+ни bulk_create().
+"""
+import base64
+import binascii
+import re
+from contextlib import contextmanager
+
+from django.core.paginator import Paginator
+from django.db import connection
+
+from .models import Post
+from .utils import CursorPaginator
+
+SEARCH_TABLE = 'posts_post_fts'
+INSERT_TRIGGER = 'posts_post_fts_insert'
+SEARCH_WORD = re.compile(r'\w+')
+MATCH_SQL = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+# pk__in=RawSQL(...) Django 2.2 оборачивает во вторые скобки, и SQLite
+# читает "id IN ((SELECT ...))" как сравнение с первой строкой подзапроса.
+MATCH_WHERE = f'{Post._meta.db_table}.id IN ({MATCH_SQL})'
+
+
+def fts_query(text):
+    """Запрос FTS5 из пользовательского текста: все слова, каждое как
+    префикс, без операторов FTS5."""
+    return ' '.join(f'"{word}"*' for word in SEARCH_WORD.findall(text))
+
+
+def filter_by_text(queryset, text):
+    """Посты queryset, в тексте которых есть все слова text."""
+    query = fts_query(text)
+    if not query:
+        return queryset.none()
+    return queryset.extra(where=[MATCH_WHERE], params=[query])
+
+
+@contextmanager
+def deferred_indexing(cursor, first_id, last_id):
+    """Индексирует посты с id от first_id до last_id одним запросом.
+
+    Для массовой вставки: построчный триггер в несколько раз медленнее.
+    Вызывается внутри транзакции вставки, поэтому другие соединения не
+    застают базу без триггера.
+    """
+    cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = %s",
+        [INSERT_TRIGGER])
+    trigger_sql, = cursor.fetchone()
+    cursor.execute(f'DROP TRIGGER {INSERT_TRIGGER}')
+    try:
+        yield
+    finally:
+        cursor.execute(trigger_sql)
+    cursor.execute(
+        f'INSERT INTO {SEARCH_TABLE} (rowid, text) SELECT id, text'
+        ' FROM posts_post WHERE id BETWEEN %s AND %s', [first_id, last_id])
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорный пагинатор результатов поиска по релевантности.
+
+    Ключ страницы - (rank, id): rank считает bm25 в FTS5, меньше - лучше.
+    Номеров страниц нет, get_page всегда отдает первую страницу.
+    """
+
+    def __init__(self, text, per_page, queryset=None):
+        Paginator.__init__(self, [], per_page)
+        self.query = fts_query(text)
+        if queryset is None:
+            queryset = Post.objects.select_related('author', 'group')
+        self.queryset = queryset
+
+    def get_page(self, number):
+        return self.get_first_cursor_page()
+
+    def _fetch(self, key, backward, limit):
+        if not self.query:
+            return []
+        sql = (f'SELECT rowid, rank FROM {SEARCH_TABLE}'
+               f' WHERE {SEARCH_TABLE} MATCH %s')
+        params = [self.query]
+        if key is not None:
+            sign = '<' if backward else '>'
+            sql += f' AND (rank {sign} %s OR (rank = %s AND rowid {sign} %s))'
+            params += [key[0], key[0], key[1]]
+        order = 'DESC' if backward else 'ASC'
+        sql += f' ORDER BY rank {order}, rowid {order} LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ranks = dict(cursor.fetchall())
+        posts = self.queryset.in_bulk(list(ranks))
+        object_list = []
+        for pk, rank in ranks.items():
+            if pk in posts:
+                posts[pk].search_rank = rank
+                object_list.append(posts[pk])
+        return object_list
+
+    def _encode(self, obj):
+        raw = f'{obj.search_rank!r}|{obj.pk}'.encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def _decode(self, token):
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            rank, pk = raw.decode().split('|')
+            return float(rank), int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
@@ -0,0 +1,247 @@
+"""Генератор больших наборов данных для нагрузочных тестов.
+
+Популярность везде степенная: немногие авторы пишут большую часть постов
+и собирают большую часть подписчиков, немногие группы и посты собирают
+большую часть записей и комментариев. Все случайные величины берутся из
+одного random.Random(seed), поэтому одинаковый seed на пустой базе дает
+одинаковые данные.
+
+Группы и пользователи создаются через bulk_create, а миллионы подписок,
+постов и комментариев - готовыми строками через executemany. Строки
+вставляются пачками с заранее известными id, поэтому связи не требуют
+повторного чтения вставленных строк. Тексты собираются из заранее
+сгенерированного Faker набора предложений: Faker на каждый из миллионов
+постов был бы самой медленной частью. Даты отсчитываются назад от
+фиксированного момента, а не от текущего времени, чтобы повторный запуск
+давал те же даты.
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+
+from .caching import bump_versions
+from .feed import PULL_AUTHORS_KEY, rebuild_feed
+from .models import Comment, Follow, Group, Post
+from .search import deferred_indexing
+from .utils import POSTS_NAMESPACE
+
+User = get_user_model()
+
+SEED_PASSWORD = 'yatube-seed'
+SEED_LOCALE = 'ru_RU'
+# Момент, к которому приходятся самые свежие данные: наивное время UTC, в
+# таком виде Django хранит даты в SQLite.
+SEED_EPOCH = datetime(2024, 1, 1)
+SENTENCE_POOL = 5000
+MAX_SENTENCES = 5
+# Чем больше показатель, тем сильнее популярность смещена к началу списка.
+AUTHOR_SKEW = 3
+GROUP_SKEW = 2
+COMMENT_SKEW = 4
+NO_GROUP_SHARE = 0.3
+# Число подписок - распределение Парето со средним FOLLOW_SHAPE / (
+# FOLLOW_SHAPE - 1), которое масштабируется до заданного среднего.
+FOLLOW_SHAPE = 1.5
+# Больше этой доли пользователей подписками не набрать за разумное время.
+MAX_FOLLOW_SHARE = 0.5
+
+
+def skewed_index(rng, size, skew):
+    """Случайный индекс в range(size) со степенным перекосом к нулю."""
+    return min(int(size * rng.random() ** skew), size - 1)
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+class Seeder:
+    def __init__(self, seed=0, batch_size=10000, days=3 * 365, log=None,
+                 now=SEED_EPOCH):
+        self.rng = random.Random(seed)
+        self.faker = Faker(SEED_LOCALE)
+        self.faker.seed_instance(seed)
+        self.batch_size = batch_size
+        if timezone.is_aware(now):
+            now = timezone.make_naive(now, timezone.utc)
+        self.finish = now
+        self.start = self.finish - timedelta(days=days)
+        self.log = log or (lambda message: None)
+        self.sentences = [
+            self.faker.sentence() for _ in range(SENTENCE_POOL)]
+        self.group_ids = []
+        self.user_ids = []
+        self.post_ids = []
+        self.post_step = timedelta(0)
+
+    def insert(self, model, objects):
+        """bulk_create генератора объектов пачками, по транзакции на пачку."""
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) == self.batch_size:
+                self._insert_batch(model, batch)
+                batch = []
+        if batch:
+            self._insert_batch(model, batch)
+
+    def _insert_batch(self, model, batch):
+        with transaction.atomic():
+            model.objects.bulk_create(batch)
+
+    def insert_rows(self, model, field_names, rows, index_posts=False):
+        """Вставляет готовые строки пачками через executemany.
+
+        Для миллионов строк bulk_create слишком дорог: почти всё время уходит
+        на сборку SQL из объектов моделей. Значения строк должны быть уже в
+        виде для базы, даты - наивными строками UTC. С index_posts первым
+        значением строки должен быть id поста.
+        """
+        columns = ', '.join(
+            connection.ops.quote_name(model._meta.get_field(name).column)
+            for name in field_names)
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(model._meta.db_table), columns,
+            ', '.join(['%s'] * len(field_names)))
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                self._execute_batch(sql, batch, index_posts)
+                batch = []
+        if batch:
+            self._execute_batch(sql, batch, index_posts)
+
+    def _execute_batch(self, sql, batch, index_posts):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not index_posts:
+                cursor.executemany(sql, batch)
+                return
+            with deferred_indexing(cursor, batch[0][0], batch[-1][0]):
+                cursor.executemany(sql, batch)
+
+    @contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        yield
+        self.log(f'{name}: {time.monotonic() - started:.1f} с')
+
+    def text(self):
+        return ' '.join(self.rng.choices(
+            self.sentences, k=self.rng.randint(1, MAX_SENTENCES)))
+
+    def make_groups(self, count):
+        first = next_id(Group)
+        self.group_ids = list(range(first, first + count))
+        with self.phase(f'Группы ({count})'):
+            self.insert(Group, (
+                Group(id=pk, title=f'{self.faker.word().capitalize()} {pk}',
+                      slug=f'group-{pk}', description=self.faker.sentence())
+                for pk in self.group_ids
+            ))
+
+    def make_users(self, count):
+        first = next_id(User)
+        self.user_ids = list(range(first, first + count))
+        password = make_password(SEED_PASSWORD)
+        with self.phase(f'Пользователи ({count})'):
+            self.insert(User, (
+                User(id=pk, username=f'{self.faker.user_name()}_{pk}',
+                     first_name=self.faker.first_name(),
+                     last_name=self.faker.last_name(),
+                     password=password,
+                     date_joined=timezone.make_aware(self.start, timezone.utc))
+                for pk in self.user_ids
+            ))
+
+    def popular_user(self):
+        return self.user_ids[
+            skewed_index(self.rng, len(self.user_ids), AUTHOR_SKEW)]
+
+    def make_follows(self, average):
+        scale = average * (FOLLOW_SHAPE - 1) / FOLLOW_SHAPE
+
+        def follows():
+            limit = int((len(self.user_ids) - 1) * MAX_FOLLOW_SHARE)
+            for user_id in self.user_ids:
+                count = min(
+                    int(self.rng.paretovariate(FOLLOW_SHAPE) * scale), limit)
+                authors = set()
+                while len(authors) < count:
+                    author_id = self.popular_user()
+                    if author_id != user_id:
+                        authors.add(author_id)
+                for author_id in sorted(authors):
+                    yield user_id, author_id
+
+        with self.phase('Подписки'):
+            self.insert_rows(Follow, ('user', 'author'), follows())
+
+    def make_posts(self, count):
+        first = next_id(Post)
+        self.post_ids = range(first, first + count)
+        self.post_step = (self.finish - self.start) / max(count, 1)
+
+        def posts():
+            for number, pk in enumerate(self.post_ids):
+                pub_date = str(self.post_date(number) + self.rng.random() * (
+                    self.post_step))
+                group_id = None
+                if self.group_ids and self.rng.random() >= NO_GROUP_SHARE:
+                    group_id = self.group_ids[skewed_index(
+                        self.rng, len(self.group_ids), GROUP_SKEW)]
+                yield (pk, self.popular_user(), group_id, self.text(), '',
+                       pub_date, pub_date)
+
+        with self.phase(f'Посты ({count})'):
+            self.insert_rows(Post, (
+                'id', 'author', 'group', 'text', 'image', 'pub_date',
+                'updated'), posts(), index_posts=True)
+
+    def post_date(self, number):
+        return self.start + number * self.post_step
+
+    def make_comments(self, count):
+        def comments():
+            posts = len(self.post_ids)
+            for _ in range(count):
+                # Больше всего комментариев у самых свежих постов.
+                number = posts - 1 - skewed_index(
+                    self.rng, posts, COMMENT_SKEW)
+                pub_date = min(
+                    self.post_date(number + 1)
+                    + self.rng.random() * timedelta(days=1),
+                    self.finish)
+                yield (self.post_ids[number], self.popular_user(),
+                       self.text(), str(pub_date))
+
+        if not self.post_ids:
+            return
+        with self.phase(f'Комментарии ({count})'):
+            self.insert_rows(
+                Comment, ('post', 'author', 'text', 'pub_date'), comments())
+
+    def build_feeds(self, count):
+        with self.phase(f'Ленты подписок ({count})'):
+            cache.delete(PULL_AUTHORS_KEY)
+            for user_id in self.user_ids[:count]:
+                rebuild_feed(user_id)
+
+    def run(self, groups, users, follows, posts, comments, feeds):
+        self.make_groups(groups)
+        self.make_users(users)
+        self.make_follows(follows)
+        self.make_posts(posts)
+        self.make_comments(comments)
+        self.build_feeds(feeds)
+        cache.delete(PULL_AUTHORS_KEY)
+        bump_versions(POSTS_NAMESPACE)
@@ -0,0 +1,122 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.storage import is_content_name
+
+from .caching import bump_versions
+from .feed import add_author_to_feed, fan_out_post, remove_author_from_feed
+from .models import Comment, Follow, Group, Post, image_storage
+from .utils import POSTS_NAMESPACE
+
+User = get_user_model()
+NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_values(sender, instance, **kwargs):
+    instance._previous_group_id = instance._previous_image = None
+    if instance.pk is not None:
+        instance._previous_group_id, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk).values_list(
+                'group_id', 'image').first() or (None, None))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    group_ids = {instance.group_id, getattr(
+        instance, '_previous_group_id', None)} - {None}
+    slugs = Group.objects.filter(id__in=group_ids).values_list(
+        'slug', flat=True)
+    bump_versions(
+        POSTS_NAMESPACE,
+        f'post:{instance.pk}',
+        f'author:{instance.author.username}',
+        *(f'group:{slug}' for slug in slugs),
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    bump_versions(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_pages(sender, instance, **kwargs):
+    bump_versions(f'group:{instance.slug}')
+
+
+@receiver(pre_save, sender=User)
+def remember_previous_name(sender, instance, update_fields=None, **kwargs):
+    instance._previous_name = None
+    if instance.pk is None:
+        return
+    if update_fields and not set(update_fields) & set(NAME_FIELDS):
+        return
+    instance._previous_name = User.objects.filter(
+        pk=instance.pk).values_list(*NAME_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_name(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_name', None)
+    current = tuple(getattr(instance, field) for field in NAME_FIELDS)
+    if created or previous is None or previous == current:
+        return
+    Post.objects.filter(author=instance).update(updated=timezone.now())
+    bump_versions(
+        POSTS_NAMESPACE,
+        f'author:{previous[0]}',
+        f'author:{instance.username}',
+    )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_pages(sender, instance, **kwargs):
+    bump_versions(
+        f'follower:{instance.user_id}',
+        f'author:{instance.author.username}',
+    )
+
+
+@receiver(post_save, sender=Post)
+def push_post_to_feeds(sender, instance, created, **kwargs):
+    if created:
+        fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def add_followed_posts(sender, instance, created, **kwargs):
+    if created:
+        add_author_to_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_unfollowed_posts(sender, instance, **kwargs):
+    remove_author_from_feed(instance.user_id, instance.author_id)
+
+
+def release_image(name):
+    """Снимает ссылку поста на файл картинки, когда транзакция завершится.
+
+    Старые файлы вне хранилища по содержимому ссылок не считают.
+    """
+    if name and is_content_name(name):
+        transaction.on_commit(lambda: image_storage.delete(name))
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_image', None)
+    if previous != instance.image.name:
+        release_image(previous)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    release_image(instance.image.name)
@@ -0,0 +1,61 @@
+from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts.thumbnails import CARD_GEOMETRY, prefetch_thumbnails
+
+register = template.Library()
+
+FRAGMENT_TEMPLATE = 'includes/post.html'
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+FRAGMENTS_KEY = 'post_fragments'
+
+
+def fragment_key(post, eager=False):
+    key = f'post_fragment:{post.pk}:{post.updated.timestamp()}'
+    return key + ':eager' if eager else key
+
+
+def render_fragment(post, eager=False):
+    return render_to_string(
+        FRAGMENT_TEMPLATE, {'post': post, 'eager': eager})
+
+
+@register.simple_tag(takes_context=True)
+def prefetch_post_fragments(context, posts):
+    """Достает из кэша карточки всех постов страницы одним get_many.
+
+    Недостающие карточки рендерятся и сохраняются одним set_many,
+    миниатюры для них тоже ищутся одним запросом. Картинка первой
+    карточки - LCP страницы, поэтому её карточка кэшируется отдельно,
+    без отложенной загрузки.
+    """
+    keys = {
+        fragment_key(post, eager=number == 0): (post, number == 0)
+        for number, post in enumerate(posts)
+    }
+    fragments = cache.get_many(list(keys))
+    missing = {
+        key: value for key, value in keys.items() if key not in fragments
+    }
+    prefetch_thumbnails(
+        [post for post, _ in missing.values()], CARD_GEOMETRY)
+    missing = {
+        key: render_fragment(post, eager)
+        for key, (post, eager) in missing.items()
+    }
+    if missing:
+        cache.set_many(missing, FRAGMENT_TIMEOUT)
+        fragments.update(missing)
+    context.render_context[FRAGMENTS_KEY] = fragments
+    return ''
+
+
+@register.simple_tag(takes_context=True)
+def post_fragment(context, post, eager=False):
+    fragments = context.render_context.get(FRAGMENTS_KEY, {})
+    fragment = fragments.get(fragment_key(post, eager))
+    if fragment is None:
+        fragment = render_fragment(post, eager)
+    return mark_safe(fragment)
@@ -0,0 +1,17 @@
+from django import template
+
+from posts.thumbnails import get_post_thumbnail, prefetch_thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def prefetch_post_thumbnails(posts, geometry):
+    """Находит миниатюры всех постов страницы до начала рендеринга."""
+    prefetch_thumbnails(posts, geometry)
+    return ''
+
+
+@register.simple_tag
+def post_thumbnail(post, geometry):
+    return get_post_thumbnail(post, geometry)
@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from posts.management.commands.benchmark import (
+    READ_VIEWS, WRITE_VIEWS, Scenarios,
+)
+from posts.models import Comment, FeedEntry, Post
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        call_command(
+            'seed', users=10, posts=60, comments=20, groups=2, follows=2,
+            feeds=1, stdout=StringIO())
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = os.path.join(directory.name, 'benchmark.json')
+        self.baseline = os.path.join(directory.name, 'baseline.json')
+
+    def benchmark(self, **options):
+        stdout = StringIO()
+        options.setdefault('output', self.output)
+        call_command(
+            'benchmark', requests=3, warmup=1, concurrency=[1, 2],
+            deep_page=3, stdout=stdout, stderr=StringIO(), **options)
+        return stdout.getvalue()
+
+    def test_report(self):
+        """Все сценарии замеряются без ошибок и сохраняются в JSON."""
+        posts = Post.objects.count()
+        comments = Comment.objects.count()
+        self.benchmark()
+        with open(self.output) as report:
+            results = json.load(report)['results']
+        self.assertEqual(
+            len(results), (2 * len(READ_VIEWS) + len(WRITE_VIEWS)) * 2)
+        for result in results:
+            with self.subTest(view=result['view'], depth=result['depth']):
+                self.assertEqual(result['errors'], 0)
+                self.assertEqual(result['requests'], 3)
+                self.assertGreater(result['p50_ms'], 0)
+        # 2 уровня по 3 запроса и по запросу разогрева.
+        self.assertEqual(Post.objects.count(), posts + 8)
+        self.assertEqual(Comment.objects.count(), comments + 8)
+
+    def test_baseline(self):
+        """С базовой линией печатаются изменения по сценариям."""
+        self.benchmark(views=['index'], output=self.baseline)
+        output = self.benchmark(views=['index'], baseline=self.baseline)
+        self.assertIn('Изменения относительно', output)
+        self.assertIn('index deep x2: p50_ms', output)
+
+    def test_follower_feed_built(self):
+        """Лента пользователя, от имени которого идут замеры, собрана."""
+        scenarios = Scenarios(deep_page=3)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=scenarios.follower).exists())
+        path, _, _ = scenarios.request('follow_index', 'deep', 0)
+        self.assertTrue(path.endswith('?before=last'))
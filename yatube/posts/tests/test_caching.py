@@ -0,0 +1,60 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+from posts.caching import bump_versions, cache_feed, is_fresh
+
+
+class CacheFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+        @cache_feed(60, 'test_page', 'test')
+        def view(request):
+            self.calls += 1
+            return HttpResponse(str(self.calls))
+
+        self.view = view
+        self.factory = RequestFactory()
+
+    def test_page_served_from_cache(self):
+        """Повторный запрос не вызывает представление."""
+        self.view(self.factory.get('/'))
+        response = self.view(self.factory.get('/'))
+        self.assertEqual(response.content, b'1')
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_page_served_while_locked(self):
+        """Пока страницу пересчитывает другой запрос, отдается старая копия."""
+        self.view(self.factory.get('/'))
+        bump_versions('test')
+        with mock.patch.object(cache, 'add', return_value=False):
+            response = self.view(self.factory.get('/'))
+        self.assertEqual(response.content, b'1')
+        response = self.view(self.factory.get('/'))
+        self.assertEqual(response.content, b'2')
+
+    def test_dynamic_namespace_resolved_on_render_only(self):
+        """Функция пространства имен не вызывается при попадании в кэш,
+        а её результат продолжает сбрасывать страницу."""
+        resolve = mock.Mock(return_value='owner:1')
+        view = cache_feed(60, 'owner_page', resolve)(
+            lambda request: HttpResponse(str(resolve.call_count)))
+        view(self.factory.get('/'))
+        self.assertEqual(view(self.factory.get('/')).content, b'1')
+        self.assertEqual(resolve.call_count, 1)
+        bump_versions('owner:1')
+        self.assertEqual(view(self.factory.get('/')).content, b'2')
+
+    def test_early_expiration(self):
+        """Дорогая страница обновляется заранее, незадолго до истечения."""
+        entry = (None, [1], time.time() + 1, 10)
+        with mock.patch('posts.caching.random.random', return_value=0.99):
+            self.assertFalse(is_fresh(entry, [1]))
+        cheap_entry = (None, [1], time.time() + 1, 0)
+        self.assertTrue(is_fresh(cheap_entry, [1]))
+        self.assertFalse(is_fresh(cheap_entry, [2]))
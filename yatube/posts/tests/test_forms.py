@@ -1,3 +1,4 @@
+import hashlib
 from http import HTTPStatus
 import shutil
 import tempfile
@@ -18,6 +19,9 @@ SMALL_GIF = (
     b'\x00\x00\x00\x2C\x00\x00\x00\x00'
     b'\x02\x00\x01\x00\x00\x02\x02\x0C'
     b'\x0A\x00\x3B')
+SMALL_GIF_SHA256 = hashlib.sha256(SMALL_GIF).hexdigest()
+SMALL_GIF_NAME = 'posts/{}/{}/{}.gif'.format(
+    SMALL_GIF_SHA256[:2], SMALL_GIF_SHA256[2:4], SMALL_GIF_SHA256)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -66,12 +70,39 @@ class PostCreateFormTests(TestCase):
             post.text: 'Другой текст',
             post.author: self.user,
             post.group: self.group,
-            post.image: 'posts/small.gif',
+            post.image: SMALL_GIF_NAME,
         }
         for field, text in fields_texts.items():
             with self.subTest(field=field):
                 self.assertEqual(field, text)
 
+    def test_create_post_records_image_size(self):
+        """Размеры картинки берутся из заголовка и сохраняются в посте."""
+        self.authorized_user.post(
+            reverse('posts:post_create'),
+            data={'text': 'Текст', 'image': self.uploaded},
+        )
+        post = Post.objects.get()
+        self.assertEqual((post.width, post.height), (2, 1))
+
+    def test_create_post_rejects_bad_uploads(self):
+        """Не картинка и слишком большой файл не сохраняются."""
+        uploads = {
+            'invalid_image': SimpleUploadedFile(
+                'fake.gif', b'not an image', content_type='image/gif'),
+            'too_large': self.uploaded,
+        }
+        for case, upload in uploads.items():
+            with self.subTest(case=case), override_settings(
+                    IMAGE_UPLOAD_MAX_SIZE=len(SMALL_GIF) - 1):
+                response = self.authorized_user.post(
+                    reverse('posts:post_create'),
+                    data={'text': 'Текст', 'image': upload},
+                )
+                errors = response.context['form'].errors.as_data()['image']
+                self.assertEqual([error.code for error in errors], [case])
+        self.assertEqual(Post.objects.count(), 0)
+
     def test_edit_post(self):
         """Валидная форма редактирует запись."""
         group_new = Group.objects.create(
@@ -0,0 +1,142 @@
+import shutil
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from posts.images import MAX_IMAGE_SIDE, process_post_image
+from core.models import StoredFile
+from core.storage import is_content_name
+from posts.models import Post, image_storage
+from posts.tests.test_forms import TEMP_MEDIA_ROOT
+
+User = get_user_model()
+EXIF_ORIENTATION = 0x0112
+ROTATED_90 = 6
+# В TestCase транзакция не завершается, и on_commit иначе не сработал бы.
+run_on_commit = mock.patch(
+    'django.db.transaction.on_commit', lambda func: func())
+
+
+def make_photo(width, height):
+    image = Image.new('RGB', (width, height), (200, 30, 30))
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = ROTATED_90
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ProcessPostImageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Пост с фотографией',
+            image=SimpleUploadedFile(
+                'photo.jpg', make_photo(4000, 3000),
+                content_type='image/jpeg'),
+        )
+        self.original = self.post.image.name
+
+    def process(self):
+        with run_on_commit, mock.patch(
+                'posts.images.generate_thumbnails') as generate:
+            result = process_post_image(self.post.pk, self.original)
+        self.post.refresh_from_db()
+        return result, generate
+
+    def test_image_is_normalized(self):
+        """Картинка уменьшается, поворачивается по EXIF и теряет EXIF."""
+        result, generate = self.process()
+        self.assertTrue(result)
+        self.assertFalse(image_storage.exists(self.original))
+        generate.assert_called_once_with(self.post.image.name)
+        with image_storage.open(self.post.image.name) as stored:
+            image = Image.open(stored)
+            self.assertEqual(image.format, 'JPEG')
+            self.assertTrue(image.info.get('progressive'))
+            self.assertNotIn('exif', image.info)
+            self.assertEqual(image.size, (1536, MAX_IMAGE_SIDE))
+        self.assertEqual(
+            (self.post.width, self.post.height), (1536, MAX_IMAGE_SIDE))
+
+    def test_thumbnails_ready_before_fragment_key_changes(self):
+        """Миниатюры создаются до того, как save сменит ключ карточки."""
+        updated = self.post.updated
+        seen = []
+        with mock.patch(
+                'posts.images.generate_thumbnails',
+                side_effect=lambda name: seen.append(
+                    Post.objects.get(pk=self.post.pk).updated)):
+            process_post_image(self.post.pk, self.original)
+        self.post.refresh_from_db()
+        self.assertEqual(seen, [updated])
+        self.assertGreater(self.post.updated, updated)
+
+    def test_replaced_image_is_left_alone(self):
+        """Если картинку успели заменить, результат обработки удаляется."""
+        Post.objects.filter(pk=self.post.pk).update(image='posts/other.jpg')
+        result, generate = self.process()
+        self.assertFalse(result)
+        generate.assert_not_called()
+        self.assertTrue(image_storage.exists(self.original))
+        self.assertEqual(self.post.image.name, 'posts/other.jpg')
+
+    def test_deleted_posts_release_image(self):
+        """Удаление поста снимает ссылку, файл уходит с последней."""
+        twin = Post.objects.create(
+            author=self.user, text='Та же фотография',
+            image=SimpleUploadedFile(
+                'twin.jpg', make_photo(4000, 3000),
+                content_type='image/jpeg'))
+        self.assertEqual(twin.image.name, self.original)
+        self.assertEqual(StoredFile.objects.get(name=self.original).refs, 2)
+        with run_on_commit:
+            self.post.delete()
+            self.assertEqual(
+                StoredFile.objects.get(name=self.original).refs, 1)
+            self.assertTrue(image_storage.exists(self.original))
+            twin.delete()
+        self.assertFalse(image_storage.exists(self.original))
+        self.assertFalse(
+            StoredFile.objects.filter(name=self.original).exists())
+
+    def test_replaced_image_released(self):
+        """Замена картинки снимает ссылку со старого файла."""
+        self.post.image = SimpleUploadedFile(
+            'other.jpg', make_photo(10, 10), content_type='image/jpeg')
+        with run_on_commit:
+            self.post.save()
+        self.assertNotEqual(self.post.image.name, self.original)
+        self.assertFalse(image_storage.exists(self.original))
+        self.assertTrue(image_storage.exists(self.post.image.name))
+
+    def test_migrate_media(self):
+        """Старые файлы переносятся в хранилище по содержимому."""
+        legacy = FileSystemStorage().save(
+            'posts/legacy.jpg', ContentFile(make_photo(10, 10)))
+        Post.objects.filter(pk=self.post.pk).update(image=legacy)
+        out = StringIO()
+        call_command('migrate_media', stdout=out)
+        self.post.refresh_from_db()
+        self.assertTrue(is_content_name(self.post.image.name))
+        self.assertTrue(image_storage.exists(self.post.image.name))
+        self.assertFalse(image_storage.exists(legacy))
+        self.assertIn('Перенесено картинок: 1', out.getvalue())
@@ -0,0 +1,118 @@
+import os
+import shutil
+import time
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts.media_gc import GC_MIN_AGE, THUMBNAIL_MAX_IDLE, collect_area
+from posts.models import Post, image_storage
+from posts.thumbnails import mark_thumbnails_used
+from posts.tests.test_forms import SMALL_GIF, TEMP_MEDIA_ROOT
+
+User = get_user_model()
+
+
+def age(storage, name, seconds):
+    moment = time.time() - seconds
+    os.utime(storage.path(name), (moment, moment))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaGarbageCollectorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                'small.gif', SMALL_GIF, content_type='image/gif'),
+        )
+
+    def save_orphan(self, content, seconds):
+        name = image_storage.save('posts/orphan.gif', ContentFile(content))
+        age(image_storage, name, seconds)
+        return name
+
+    def save_thumbnail(self, name, seconds, register):
+        thumbnail = ImageFile(name, default.storage)
+        default.storage.save(name, ContentFile(SMALL_GIF))
+        if register:
+            default.kvstore.set(thumbnail)
+        age(default.storage, name, seconds)
+        return thumbnail
+
+    def test_unreferenced_originals_are_collected(self):
+        """Картинки без постов удаляются, кроме совсем новых."""
+        old = self.save_orphan(b'GIF89a old', GC_MIN_AGE + 1)
+        young = self.save_orphan(b'GIF89a young', 0)
+        age(image_storage, self.post.image.name, GC_MIN_AGE + 1)
+        out = StringIO()
+        call_command('collect_media', area=['originals'], stdout=out)
+        self.assertFalse(image_storage.exists(old))
+        self.assertTrue(image_storage.exists(young))
+        self.assertTrue(image_storage.exists(self.post.image.name))
+        self.assertIn('удалено 1', out.getvalue())
+
+    def test_thumbnails_collected_by_registration_and_idle_time(self):
+        """Удаляются незарегистрированные и давно не запрашиваемые
+        миниатюры."""
+        unknown = self.save_thumbnail('cache/aa/unknown.gif', GC_MIN_AGE + 1,
+                                      register=False)
+        idle = self.save_thumbnail('cache/bb/idle.gif', THUMBNAIL_MAX_IDLE,
+                                   register=True)
+        fresh = self.save_thumbnail('cache/cc/fresh.gif', GC_MIN_AGE + 1,
+                                    register=True)
+        self.assertEqual(collect_area('thumbnails', 100), (3, 2, True))
+        self.assertFalse(unknown.exists())
+        self.assertFalse(idle.exists())
+        self.assertIsNone(default.kvstore.get(idle))
+        self.assertTrue(fresh.exists())
+
+    def test_collection_resumes(self):
+        """Обход ограничен max_files и продолжается со следующего файла."""
+        first = self.save_orphan(b'GIF89a first', GC_MIN_AGE + 1)
+        second = self.save_orphan(b'GIF89a second', GC_MIN_AGE + 1)
+        runs = []
+        while True:
+            scanned, collected, finished = collect_area('originals', 1)
+            runs.append(collected)
+            if finished:
+                break
+        self.assertEqual(sum(runs), 2)
+        self.assertGreaterEqual(len(runs), 3)
+        self.assertFalse(image_storage.exists(first))
+        self.assertFalse(image_storage.exists(second))
+
+    def test_idle_time_from_page_references(self):
+        """Давность определяется по ссылкам со страниц, а не по времени
+        доступа к файлу, которое с noatime не меняется."""
+        shown = self.save_thumbnail('cache/dd/shown.gif', THUMBNAIL_MAX_IDLE,
+                                    register=True)
+        read = self.save_thumbnail('cache/ee/read.gif', THUMBNAIL_MAX_IDLE,
+                                   register=True)
+        os.utime(default.storage.path(read.name), (
+            time.time(), os.stat(default.storage.path(read.name)).st_mtime))
+        mark_thumbnails_used([shown])
+        self.assertEqual(collect_area('thumbnails', 100), (2, 1, True))
+        self.assertTrue(shown.exists())
+        self.assertFalse(read.exists())
+        self.assertIsNone(default.kvstore.get(read))
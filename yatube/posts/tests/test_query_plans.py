@@ -0,0 +1,114 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from posts.search import SEARCH_TABLE
+
+User = get_user_model()
+POSTS_COUNT = 30
+# Просмотр таблицы целиком. Проход по покрывающему индексу допустим:
+# так SQLite считает COUNT(*) всей ленты, а его результат кэшируется.
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?\w+(?! .*INDEX)(?: AS \w+)?$')
+TEMP_SORT = 'USE TEMP B-TREE'
+
+
+def query_plan(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanTests(TestCase):
+    """Запросы страниц не просматривают таблицы целиком и не сортируют
+    результат во временном B-дереве."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Post.objects.bulk_create(
+            Post(author=cls.author, group=cls.group, text=f'Пост {number}')
+            for number in range(POSTS_COUNT)
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост с комментариями')
+        Comment.objects.bulk_create(
+            Comment(author=cls.reader, post=cls.post, text=f'Ответ {number}')
+            for number in range(POSTS_COUNT)
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def page_queries(self, url, data=None):
+        """SELECT-запросы, которые выполнило представление по адресу url."""
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        cache.clear()
+        with connection.execute_wrapper(record):
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return queries, response
+
+    def assert_indexed(self, url, data=None):
+        queries, response = self.page_queries(url, data)
+        for sql, params in queries:
+            # Совпадения FTS5 сортируются по bm25, который считается для
+            # каждого найденного поста, поэтому без сортировки не обойтись.
+            if SEARCH_TABLE in sql:
+                continue
+            with self.subTest(url=url, sql=sql):
+                plan = query_plan(sql, params)
+                self.assertFalse(
+                    [step for step in plan if FULL_SCAN.match(step)], plan)
+                self.assertFalse(
+                    [step for step in plan if TEMP_SORT in step], plan)
+        return response
+
+    def test_detects_full_scan(self):
+        """Проверка находит запрос без подходящего индекса."""
+        sql, params = Post.objects.filter(
+            text__contains='Пост').order_by('text').query.sql_with_params()
+        plan = query_plan(sql, params)
+        self.assertTrue([step for step in plan if FULL_SCAN.match(step)])
+        self.assertTrue([step for step in plan if TEMP_SORT in step])
+
+    def test_feeds(self):
+        """Ленты и их курсорные страницы читаются по индексам."""
+        index = reverse('posts:index')
+        response = self.assert_indexed(index)
+        self.assert_indexed(index, {'page': 2})
+        self.assert_indexed(
+            index, {'after': response.context['page_obj'].next_cursor})
+        self.assert_indexed(index, {'before': 'last'})
+        self.assert_indexed(reverse('posts:group_list', args=('group',)))
+        self.assert_indexed(reverse('posts:profile', args=('author',)))
+        self.assert_indexed(reverse('posts:search'), {'q': 'пост'})
+
+    def test_follow_feed(self):
+        """Лента подписок читается по индексам и с pull-авторами."""
+        self.assert_indexed(reverse('posts:follow_index'))
+        with self.settings(FEED_PULL_FOLLOWERS=1):
+            self.assert_indexed(reverse('posts:follow_index'))
+
+    def test_post_pages(self):
+        """Страница поста и его комментарии читаются по индексам."""
+        self.assert_indexed(
+            reverse('posts:post_detail', args=(self.post.id,)))
+        self.assert_indexed(
+            reverse('posts:post_comments', args=(self.post.id,)))
@@ -0,0 +1,80 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Post
+from posts.search import SearchPaginator, filter_by_text, fts_query
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.posts = Post.objects.bulk_create([
+            Post(author=cls.user, text=f'Пост {number} про котов')
+            for number in range(15)
+        ])
+        cls.best = Post.objects.create(
+            author=cls.user, text='Коты, коты и снова коты')
+        cls.other = Post.objects.create(author=cls.user, text='Про собак')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_query_is_escaped(self):
+        """Операторы FTS5 из запроса не выполняются."""
+        self.assertEqual(fts_query('кот OR "собак*'), '"кот"* "OR"* "собак"*')
+        self.assertEqual(fts_query('!!!'), '')
+
+    def test_ranked_results(self):
+        """Самый релевантный пост идет первым, лишние не попадают."""
+        page = SearchPaginator('кот', 20).get_page(1)
+        self.assertEqual(page.object_list[0], self.best)
+        self.assertEqual(len(page.object_list), 16)
+        self.assertNotIn(self.other, page.object_list)
+
+    def test_cursor_pages(self):
+        """Курсорные страницы не повторяют и не теряют результаты."""
+        paginator = SearchPaginator('котов', 10)
+        first = paginator.get_page(1)
+        second = paginator.get_cursor_page(after=first.next_cursor)
+        self.assertIsNone(second.next_cursor)
+        found = list(first.object_list) + list(second.object_list)
+        self.assertEqual(len(found), 15)
+        self.assertEqual(len(set(found)), 15)
+        back = paginator.get_cursor_page(before=second.previous_cursor)
+        self.assertEqual(list(back.object_list), list(first.object_list))
+
+    def test_filter_finds_all_matches(self):
+        """Фильтр по тексту возвращает все подходящие посты, а не первый."""
+        found = filter_by_text(Post.objects, 'котов')
+        self.assertEqual(found.count(), len(self.posts))
+
+    def test_index_follows_text(self):
+        """Триггеры обновляют индекс при изменении и удалении постов."""
+        Post.objects.filter(pk=self.other.pk).update(text='Про ежей')
+        self.assertFalse(filter_by_text(Post.objects, 'собак').exists())
+        self.assertEqual(
+            list(filter_by_text(Post.objects, 'ежей')), [self.other])
+        self.other.delete()
+        self.assertFalse(filter_by_text(Post.objects, 'ежей').exists())
+
+    def test_view_keeps_query_in_links(self):
+        """Ссылки пагинации страницы поиска сохраняют запрос."""
+        response = Client().get(reverse('posts:search'), {'q': 'котов'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertContains(
+            response, '?q=%D0%BA%D0%BE%D1%82%D0%BE%D0%B2&amp;after=')
+
+    def test_admin_uses_index(self):
+        """Поиск в админке находит посты через полнотекстовый индекс."""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        client = Client()
+        client.force_login(admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собак'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.other])
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Count, F, Max
+from django.test import TestCase
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post
+from posts.search import filter_by_text
+
+User = get_user_model()
+
+
+def seed(*args, **options):
+    options = dict(
+        users=30, posts=300, comments=150, groups=4, follows=3, feeds=2,
+        batch_size=64, stdout=StringIO(), **options)
+    call_command('seed', *args, **options)
+
+
+class SeedCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_counts(self):
+        """Создается заданное число строк, связи корректны."""
+        seed()
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 4)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 150)
+        self.assertTrue(Follow.objects.exists())
+        self.assertFalse(Follow.objects.filter(
+            user_id=F('author_id')).exists())
+        self.assertTrue(User.objects.first().check_password('yatube-seed'))
+
+    def test_popularity_is_skewed(self):
+        """Самый активный автор пишет заметно больше среднего."""
+        seed()
+        counts = Post.objects.order_by().values('author').annotate(
+            total=Count('id')).values_list('total', flat=True)
+        counts = sorted(counts, reverse=True)
+        self.assertGreater(counts[0], 3 * 300 / 30)
+
+    def test_deterministic(self):
+        """Одинаковый seed дает одинаковые тексты и даты."""
+        def snapshot():
+            return (
+                list(Post.objects.order_by('id').values_list(
+                    'text', 'pub_date')),
+                list(Comment.objects.order_by('id').values_list(
+                    'text', 'pub_date')),
+            )
+
+        seed(seed=7)
+        first = snapshot()
+        Post.objects.all().delete()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        seed(seed=7)
+        self.assertEqual(snapshot(), first)
+
+    def test_dates_end_at_now(self):
+        """Самые свежие данные приходятся на дату --now."""
+        now = timezone.make_aware(datetime(2020, 5, 1), timezone.utc)
+        seed('--now=2020-05-01', days=30)
+        latest = Post.objects.aggregate(latest=Max('pub_date'))['latest']
+        self.assertLessEqual(latest, now)
+        self.assertGreater(latest, now - timedelta(days=1))
+
+    def test_posts_are_searchable(self):
+        """Посты попадают в полнотекстовый индекс, триггер восстановлен."""
+        seed()
+        post = Post.objects.order_by('?').first()
+        word = post.text.split()[0].strip('.,')
+        self.assertIn(post, filter_by_text(Post.objects, word))
+        new = Post.objects.create(author=post.author, text='Уникальноеслово')
+        self.assertEqual(
+            list(filter_by_text(Post.objects, 'Уникальноеслово')), [new])
@@ -0,0 +1,204 @@
+import shutil
+from http import HTTPStatus
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from posts.models import Post
+from posts.tests.test_forms import SMALL_GIF, TEMP_MEDIA_ROOT
+from posts.thumbnails import (
+    CARD_GEOMETRY, THUMBNAIL_GEOMETRIES, THUMBNAIL_OPTIONS, THUMBNAIL_USED_KEY,
+    generate_thumbnails, get_post_thumbnail, prefetch_thumbnails,
+    submit_thumbnails, thumbnail_file, thumbnail_variants, thumbnail_version,
+)
+
+User = get_user_model()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                'thumb.gif', SMALL_GIF, content_type='image/gif'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.thumbnail_url = reverse(
+            'posts:post_thumbnail', args=(self.post.id, CARD_GEOMETRY))
+
+    def store_card_thumbnail(self):
+        """Кладет готовую миниатюру туда, где её ищет sorl-thumbnail."""
+        name = thumbnail_file(self.post.image, CARD_GEOMETRY).name
+        default.storage.save(name, ContentFile(SMALL_GIF))
+        return get_thumbnail(
+            self.post.image, CARD_GEOMETRY, **THUMBNAIL_OPTIONS)
+
+    def test_thumbnail_file_matches_sorl(self):
+        """Имя миниатюры совпадает с тем, что выбирает sorl-thumbnail."""
+        thumbnail = self.store_card_thumbnail()
+        self.assertEqual(
+            thumbnail.name,
+            thumbnail_file(self.post.image, CARD_GEOMETRY).name)
+
+    def test_prefetch_thumbnails_one_cache_lookup(self):
+        """Миниатюры страницы находятся одним get_many."""
+        thumbnail = self.store_card_thumbnail()
+        posts = [Post.objects.get(pk=self.post.pk) for _ in range(3)]
+        kvstore_cache = default.kvstore.cache
+        with mock.patch.object(
+            kvstore_cache, 'get_many', wraps=kvstore_cache.get_many,
+        ) as get_many, mock.patch.object(kvstore_cache, 'get') as get:
+            prefetch_thumbnails(posts, CARD_GEOMETRY)
+            with mock.patch('posts.thumbnails.get_thumbnail') as fallback:
+                for post in posts:
+                    self.assertEqual(
+                        get_post_thumbnail(post, CARD_GEOMETRY).url,
+                        thumbnail.url)
+        get_many.assert_called_once()
+        get.assert_not_called()
+        fallback.assert_not_called()
+        self.assertIsNotNone(
+            cache.get(THUMBNAIL_USED_KEY.format(thumbnail.key)))
+
+    def test_missing_thumbnail_points_to_endpoint(self):
+        """Вместо несозданной миниатюры страница получает адрес эндпоинта."""
+        prefetch_thumbnails([self.post], CARD_GEOMETRY)
+        with mock.patch('posts.thumbnails.get_thumbnail') as get:
+            thumbnail = get_post_thumbnail(self.post, CARD_GEOMETRY)
+        get.assert_not_called()
+        self.assertTrue(thumbnail.url.startswith(self.thumbnail_url))
+
+    def test_endpoint_serves_ready_thumbnail(self):
+        """Готовая миниатюра отдается с долгим кэшированием."""
+        thumbnail = self.store_card_thumbnail()
+        url = get_post_thumbnail(
+            Post.objects.get(pk=self.post.pk), CARD_GEOMETRY).url
+        self.assertEqual(url, thumbnail.url)
+        response = self.client.get(self.thumbnail_url, {
+            'v': thumbnail_version(self.post.image)})
+        self.assertEqual(b''.join(response.streaming_content), SMALL_GIF)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept')
+
+    def test_endpoint_returns_placeholder(self):
+        """Если миниатюра не создалась, отдается заглушка без кэширования."""
+        with mock.patch(
+            'posts.thumbnails.generate_thumbnail', return_value=False,
+        ) as generate:
+            response = self.client.get(self.thumbnail_url)
+        generate.assert_called_once_with(
+            self.post.image.name, CARD_GEOMETRY, None)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_failure_not_resubmitted(self):
+        """После неудачи следующий запрос не ставит новую задачу."""
+        with mock.patch(
+            'posts.thumbnails.generate_thumbnail', return_value=False,
+        ) as generate:
+            self.client.get(self.thumbnail_url)
+            response = self.client.get(self.thumbnail_url)
+        generate.assert_called_once()
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+
+    def test_endpoint_generates_once_under_lock(self):
+        """Пока миниатюру создает другой запрос, новая работа не ставится."""
+        lock_key = 'thumbnail.lock.' + thumbnail_file(
+            self.post.image, CARD_GEOMETRY).key
+        cache.add(lock_key, 1)
+        with mock.patch('posts.thumbnails.submit') as submit:
+            response = self.client.get(self.thumbnail_url)
+        submit.assert_not_called()
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+
+    def test_endpoint_rejects_unknown_geometry(self):
+        """Произвольные размеры эндпоинт не создает."""
+        response = self.client.get(reverse(
+            'posts:post_thumbnail', args=(self.post.id, '5000x5000')))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_generate_thumbnails_uses_template_geometries(self):
+        """Создаются все варианты размеров из шаблонов в WebP и в формате
+        исходной картинки."""
+        with mock.patch('posts.thumbnails.get_thumbnail') as get_thumbnail:
+            self.assertTrue(generate_thumbnails(self.post.image.name))
+        calls = [
+            (source.key, geometry, options.get('format'))
+            for (source, geometry), options in get_thumbnail.call_args_list
+        ]
+        # Ключ источника тот же, что у картинки поста в шаблонах.
+        source_key = ImageFile(self.post.image).key
+        for geometry in THUMBNAIL_GEOMETRIES:
+            for variant in thumbnail_variants(geometry):
+                self.assertIn((source_key, variant, None), calls)
+                self.assertIn((source_key, variant, 'WEBP'), calls)
+        self.assertEqual(len(calls), len(set(calls)))
+
+    def test_srcset_lists_all_widths(self):
+        """srcset содержит все ширины, WebP запрашивается явно."""
+        thumbnail = self.store_card_thumbnail()
+        post = Post.objects.get(pk=self.post.pk)
+        im = get_post_thumbnail(post, CARD_GEOMETRY)
+        self.assertIn(f'{thumbnail.url} 480w', im.srcset)
+        for variant in thumbnail_variants(CARD_GEOMETRY):
+            width = variant.split('x')[0]
+            self.assertIn(f'{width}w', im.srcset)
+            self.assertIn(f'format=webp {width}w', im.webp_srcset)
+
+    def test_endpoint_negotiates_format(self):
+        """Без ?format= эндпоинт выбирает формат по Accept."""
+        with mock.patch(
+            'posts.views.request_thumbnail', return_value=None,
+        ) as request_thumbnail:
+            self.client.get(self.thumbnail_url, HTTP_ACCEPT='image/webp,*/*')
+            self.client.get(self.thumbnail_url, HTTP_ACCEPT='image/*')
+            self.client.get(self.thumbnail_url + '?format=webp')
+        self.assertEqual(
+            [call.args[2] for call in request_thumbnail.call_args_list],
+            ['WEBP', None, 'WEBP'])
+
+    def test_broken_image_does_not_raise(self):
+        """Ошибка при создании миниатюры не роняет воркер."""
+        with mock.patch(
+            'posts.thumbnails.get_thumbnail', side_effect=OSError,
+        ):
+            self.assertFalse(generate_thumbnails(self.post.image.name))
+
+    def test_submit_without_workers_runs_inline(self):
+        """При THUMBNAIL_WORKERS = 0 миниатюры создаются сразу."""
+        with mock.patch('posts.thumbnails.generate_thumbnails') as generate:
+            submit_thumbnails(self.post.image.name)
+        generate.assert_called_once_with(self.post.image.name)
+
+    def test_warm_thumbnails_command(self):
+        """Команда обходит картинки существующих постов."""
+        Post.objects.create(author=self.user, text='Пост без картинки')
+        out = StringIO()
+        with mock.patch(
+            'posts.management.commands.warm_thumbnails.generate_thumbnails',
+            return_value=True,
+        ) as generate:
+            call_command('warm_thumbnails', workers=0, stdout=out)
+        generate.assert_called_once_with(self.post.image.name)
+        self.assertIn('Обработано картинок: 1', out.getvalue())
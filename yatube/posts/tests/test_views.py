@@ -1,19 +1,30 @@
 from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+from unittest import mock
 import shutil
-from posts.tests.test_forms import SMALL_GIF, TEMP_MEDIA_ROOT
+from posts.tests.test_forms import SMALL_GIF, SMALL_GIF_NAME, TEMP_MEDIA_ROOT
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django import forms
-from posts.models import Post, Group, Follow
+from posts.models import Comment, Post, Group, Follow, FeedEntry
+from posts.feed import FEED_BATCH_SIZE, PULL_AUTHORS_KEY
+from posts.templatetags.post_cache import fragment_key
+from posts.utils import (
+    COMMENT_IN_PAGE, ELLIPSIS, NUMBERED_PAGES, FeedPaginator, cursor_slice,
+)
 
 User = get_user_model()
 TEST_POST = 12
 OBJ_IN_FIRST_PAGE = 10
+COMMENTS_COUNT = 25
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, QUERY_BUDGETS='raise')
 class PostsPagesTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -89,12 +100,24 @@ class PostsPagesTests(TestCase):
             response.context.get('post').text: self.post.text,
             response.context.get('post').author: self.post.author,
             response.context.get('post').group: self.post.group,
-            response.context.get('post').image: 'posts/small.gif',
+            response.context.get('post').image: SMALL_GIF_NAME,
         }
         for objfield, expfield in objfields_expectedfields.items():
             with self.subTest(objfield=objfield):
                 self.assertEqual(objfield, expfield)
 
+    def test_post_detail_cache_hit_without_queries(self):
+        """Закэшированная страница поста отдается без запросов к базе и
+        сбрасывается новым постом автора."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        guest = Client()
+        guest.get(url)
+        with self.assertNumQueries(0):
+            guest.get(url)
+        Post.objects.create(text='Еще пост', author=self.user)
+        response = guest.get(url)
+        self.assertEqual(response.context['author_posts_count'], 2)
+
     def test_form_create_and_edit(self):
         """Проверка контекста создания и редактирования поста"""
         responses = [
@@ -191,12 +214,72 @@ class PostsPagesTests(TestCase):
         )
         response_before_del = self.authorized_user.get(reverse('posts:index'))
         cache_before_delete = response_before_del.content
+        Post.objects.filter(pk=post_cache.pk).update(text='Без сигналов')
+        response_cached = self.authorized_user.get(reverse('posts:index'))
+        self.assertEqual(cache_before_delete, response_cached.content)
         post_cache.delete()
         response_after_del = self.authorized_user.get(reverse('posts:index'))
         cache_after_delete = response_after_del.content
-        self.assertEqual(cache_before_delete, cache_after_delete)
+        self.assertNotEqual(cache_before_delete, cache_after_delete)
+        self.assertNotIn(post_cache, response_after_del.context['page_obj'])
+
+    def test_cache_not_shared_between_users(self):
+        """Закэшированная страница одного пользователя не видна другому"""
+        other_user = User.objects.create_user(username='Other')
+        other_client = Client()
+        other_client.force_login(other_user)
+        self.authorized_user.get(reverse('posts:index'))
+        response = other_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Пользователь: Other')
 
+    def test_group_cache_invalidated_on_edit(self):
+        """Страница группы обновляется, когда пост уходит в другую группу"""
+        group_new = Group.objects.create(
+            title='Другая группа', slug='other_slug', description='-')
+        post = Post.objects.get(pk=self.post.pk)
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.assertIn(post, self.authorized_user.get(url).context['page_obj'])
+        post.group = group_new
+        post.save()
+        response = self.authorized_user.get(url)
+        self.assertNotIn(post, response.context['page_obj'])
 
+    def test_post_fragment_cached_and_invalidated_on_rename(self):
+        """Карточка поста кэшируется и обновляется при смене имени автора"""
+        self.authorized_user.get(reverse('posts:index'))
+        self.assertIsNotNone(cache.get(fragment_key(self.post, eager=True)))
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Лев'
+        author.last_name = 'Толстой'
+        author.save()
+        response = self.authorized_user.get(reverse('posts:index'))
+        self.assertContains(response, 'Автор: Лев Толстой')
+
+    def test_first_image_not_lazy(self):
+        """Картинка первого поста грузится сразу, остальные - отложенно."""
+        Post.objects.create(
+            text='Второй пост', author=self.user, group=self.group,
+            image=SimpleUploadedFile(
+                'small.gif', SMALL_GIF, content_type='image/gif'))
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.user.username,)),
+        ):
+            with self.subTest(url=url):
+                content = self.authorized_user.get(url).content.decode()
+                self.assertEqual(content.count('fetchpriority="high"'), 1)
+                self.assertEqual(content.count('loading="lazy"'), 1)
+                self.assertLess(
+                    content.index('fetchpriority="high"'),
+                    content.index('loading="lazy"'))
+        response = self.authorized_user.get(
+            reverse('posts:post_detail', args=(self.post.id,)))
+        self.assertContains(response, 'fetchpriority="high"')
+        self.assertNotContains(response, 'loading="lazy"')
+
+
+@override_settings(QUERY_BUDGETS='raise')
 class PaginatorTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -242,3 +325,217 @@ class PaginatorTests(TestCase):
             response = self.authorized_user.get(url + '?page=2')
             self.assertEqual(
                 len(response.context['page_obj']), OBJ_IN_SECOND_PAGE)
+
+    def test_paginators_cursor_pages(self):
+        """Проверка keyset-пагинации по курсорам after и before."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                first_page = self.authorized_user.get(url).context['page_obj']
+                second_page = self.authorized_user.get(
+                    url + '?after=' + first_page.next_cursor
+                ).context['page_obj']
+                self.assertEqual(len(second_page), 3)
+                self.assertIsNone(second_page.next_cursor)
+                back_page = self.authorized_user.get(
+                    url + '?before=' + second_page.previous_cursor
+                ).context['page_obj']
+                self.assertEqual(list(back_page), list(first_page))
+                self.assertIsNone(back_page.previous_cursor)
+
+    def test_paginators_cursor_last_and_broken(self):
+        """Проверка последней страницы и испорченного курсора."""
+        url = reverse('posts:index')
+        last_page = self.authorized_user.get(
+            url + '?before=last').context['page_obj']
+        expected = list(Post.objects.order_by('pub_date', 'id')[:10])
+        self.assertEqual(list(last_page), expected[::-1])
+        self.assertIsNone(last_page.next_cursor)
+        broken_page = self.authorized_user.get(
+            url + '?after=broken').context['page_obj']
+        self.assertEqual(broken_page.number, 1)
+
+    def test_paginator_count_cached_until_posts_change(self):
+        """Счетчик ленты берется из кэша, пока посты не изменились."""
+        url = reverse('posts:group_list', kwargs={'slug': 'test_slug'})
+        self.authorized_user.get(url)
+        with self.assertNumQueries(0):
+            FeedPaginator(self.group.posts.all(), OBJ_IN_FIRST_PAGE).count
+        Post.objects.create(
+            text='Новый пост', author=self.user, group=self.group)
+        self.assertEqual(
+            FeedPaginator(self.group.posts.all(), OBJ_IN_FIRST_PAGE).count,
+            TEST_POST + 2)
+
+    def test_paginator_elided_page_range(self):
+        """Номера страниц выводятся окном вокруг текущей, но только в
+        начале ленты: к концу ведет курсор."""
+        paginator = FeedPaginator(Post.objects.all(), 1)
+        self.assertEqual(
+            paginator.get_elided_page_range(1), [1, 2, 3, 4, ELLIPSIS])
+        self.assertEqual(
+            paginator.get_elided_page_range(9),
+            [1, 2, ELLIPSIS, 6, 7, 8, 9, 10, ELLIPSIS])
+        self.assertEqual(
+            paginator.get_elided_page_range(13), [1, 2, ELLIPSIS, 13])
+
+    def test_paginator_links_avoid_deep_offsets(self):
+        """Ссылки с номером не ведут дальше NUMBERED_PAGES."""
+        Post.objects.bulk_create(
+            Post(text='Пост', author=self.user)
+            for _ in range(2 * NUMBERED_PAGES * OBJ_IN_FIRST_PAGE))
+        cache.clear()
+        response = self.authorized_user.get(
+            reverse('posts:index') + '?page=2')
+        content = response.content.decode()
+        self.assertIn('before=last', content)
+        for number in range(NUMBERED_PAGES + 1, 2 * NUMBERED_PAGES + 2):
+            self.assertNotIn(f'page={number}"', content)
+
+
+@override_settings(QUERY_BUDGETS='raise')
+class FollowFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Follower')
+        cls.author = User.objects.create_user(username='Author')
+        cls.authorized_user = Client()
+        cls.authorized_user.force_login(cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_new_post_pushed_to_follower_feed(self):
+        """Новый пост автора попадает в материализованную ленту."""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.user, post=post).exists())
+        response = self.authorized_user.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+
+    def test_numbered_pages_not_materialized(self):
+        """Номер страницы в ленте подписок не читает ленту целиком."""
+        Follow.objects.create(user=self.user, author=self.author)
+        posts = [
+            Post.objects.create(text=f'Пост {number}', author=self.author)
+            for number in range(OBJ_IN_FIRST_PAGE + 2)
+        ]
+        with mock.patch('posts.feed.cursor_slice',
+                        wraps=cursor_slice) as fetch:
+            response = self.authorized_user.get(
+                reverse('posts:follow_index') + '?page=1000')
+        page = response.context['page_obj']
+        self.assertEqual(list(page), posts[::-1][:OBJ_IN_FIRST_PAGE])
+        self.assertIsNone(page.number)
+        self.assertIsNotNone(page.next_cursor)
+        for call in fetch.call_args_list:
+            self.assertLessEqual(call.args[3], OBJ_IN_FIRST_PAGE + 1)
+
+    def test_feed_batches_fit_sqlite_limit(self):
+        """Рассылка и догрузка ленты больше чем на FEED_BATCH_SIZE строк."""
+        User.objects.bulk_create(
+            User(username=f'Fan{number}')
+            for number in range(FEED_BATCH_SIZE + 1))
+        Follow.objects.bulk_create(
+            Follow(user=fan, author=self.author)
+            for fan in User.objects.filter(username__startswith='Fan'))
+        cache.clear()
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(
+            FeedEntry.objects.filter(post=post).count(), FEED_BATCH_SIZE + 1)
+        Post.objects.bulk_create(
+            Post(text='Пост', author=self.author)
+            for _ in range(FEED_BATCH_SIZE))
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.user).count(),
+            FEED_BATCH_SIZE + 1)
+
+    def test_rebuild_feeds_command(self):
+        """Команда rebuild_feeds восстанавливает ленту по подпискам."""
+        post = Post.objects.create(text='Старый пост', author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_feeds', stdout=StringIO())
+        self.assertEqual(
+            list(FeedEntry.objects.values_list('user', 'post')),
+            [(self.user.id, post.id)])
+
+    @override_settings(FEED_PULL_FOLLOWERS=2)
+    def test_pull_author_posts_merged_into_feed(self):
+        """Посты популярного автора подмешиваются в ленту при чтении."""
+        star = User.objects.create_user(username='Star')
+        fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=star)
+        Follow.objects.create(user=fan, author=star)
+        cache.clear()
+        old_post = Post.objects.create(text='Обычный', author=self.author)
+        star_post = Post.objects.create(text='Популярный', author=star)
+        new_post = Post.objects.create(text='Обычный 2', author=self.author)
+        self.assertFalse(FeedEntry.objects.filter(post=star_post).exists())
+        response = self.authorized_user.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [new_post, star_post, old_post])
+
+    @override_settings(FEED_PULL_FOLLOWERS=2)
+    def test_demoted_pull_author_posts_kept(self):
+        """Посты, написанные автором в pull-множестве, остаются в ленте,
+        когда у него становится меньше подписчиков."""
+        fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=self.user, author=self.author)
+        unfollow = Follow.objects.create(user=fan, author=self.author)
+        cache.clear()
+        post = Post.objects.create(text='Популярный', author=self.author)
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        unfollow.delete()
+        cache.delete(PULL_AUTHORS_KEY)
+        response = self.authorized_user.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.user, post=post).exists())
+
+
+@override_settings(QUERY_BUDGETS='raise')
+class CommentsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='NoName')
+        cls.post = Post.objects.create(text='Тестовый текст', author=cls.user)
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=User.objects.create_user(
+                username=f'Commenter{number}'), text=f'Комментарий {number}')
+            for number in range(COMMENTS_COUNT)
+        )
+        cls.guest_client = Client()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_comments_paginated_by_cursor(self):
+        """Комментарии выводятся страницами, следующая - по курсору"""
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENT_IN_PAGE)
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.id}),
+            {'after': comments.next_cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertEqual(
+            len(response.context['comments']),
+            COMMENTS_COUNT - COMMENT_IN_PAGE)
+
+    def test_comment_authors_without_extra_queries(self):
+        """Авторы комментариев загружаются вместе с комментариями"""
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.id}))
+        author_queries = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('SELECT "auth_user"')
+        ]
+        self.assertLessEqual(len(author_queries), 1)
@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from posts.workers import make_executor
+
+
+def worker_settings():
+    return os.environ['DJANGO_SETTINGS_MODULE'], settings.MEDIA_ROOT
+
+
+class WorkersTests(SimpleTestCase):
+    def test_tests_run_inline(self):
+        """В тестах пул воркеров не запускается."""
+        self.assertEqual(settings.THUMBNAIL_WORKERS, 0)
+
+    def test_worker_gets_parent_settings(self):
+        """Воркер получает модуль настроек и подмененные настройки."""
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(MEDIA_ROOT=directory):
+                with make_executor(1) as executor:
+                    result = executor.submit(worker_settings).result()
+        self.assertEqual(
+            result, (os.environ['DJANGO_SETTINGS_MODULE'], directory))
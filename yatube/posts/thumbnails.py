@@ -0,0 +1,271 @@
+"""Миниатюры картинок постов, которые создаются заранее, а не в шаблоне.
+
+Готовую миниатюру страница берет из хранилища sorl-thumbnail и отдает её
+адрес. Если миниатюры ещё нет, вместо неё в страницу попадает адрес
+представления post_thumbnail, которое создает её отдельно от рендеринга,
+поэтому страница никогда не декодирует картинку во время запроса.
+"""
+import logging
+import time
+from concurrent.futures import wait
+
+from django.core.cache import cache
+from django.urls import reverse
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from core.metrics import timing
+
+from .models import image_storage
+from .workers import submit
+
+logger = logging.getLogger(__name__)
+
+CARD_GEOMETRY = '480x170'
+DETAIL_GEOMETRY = '960x339'
+THUMBNAIL_GEOMETRIES = (CARD_GEOMETRY, DETAIL_GEOMETRY)
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+# Ширины вариантов относительно основного размера: для srcset.
+THUMBNAIL_SCALES = (0.5, 1, 2)
+# None - формат исходной картинки (THUMBNAIL_PRESERVE_FORMAT).
+THUMBNAIL_FORMATS = {'original': None, 'webp': 'WEBP'}
+THUMBNAIL_SIZES = '(min-width: 1400px) 990px, (min-width: 768px) 75vw, 100vw'
+THUMBNAIL_DEADLINE = 0.5
+THUMBNAIL_POLL = 0.05
+THUMBNAIL_LOCK_TIMEOUT = 60
+# Сколько после неудачи отдавать заглушку, не ставя новую задачу: иначе
+# каждая загрузка сломанной картинки занимала бы воркер.
+THUMBNAIL_FAILURE_TIMEOUT = 60 * 60
+# Когда на миниатюру последний раз ссылалась страница: по этой отметке
+# сборщик мусора удаляет давно не нужные. Время доступа к файлу не годится:
+# с noatime и relatime оно почти не меняется, а готовые файлы отдает
+# веб-сервер, минуя Django.
+THUMBNAIL_USED_KEY = 'thumbnail.used.{}'
+# Намного дольше, чем живут закэшированные страницы со ссылками на файлы.
+THUMBNAIL_MAX_IDLE = 60 * 60 * 24 * 30
+PLACEHOLDER_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}">'
+    '<rect width="100%" height="100%" fill="#e9ecef"/></svg>'
+)
+
+
+def thumbnail_variants(geometry):
+    """Размеры вариантов миниатюры geometry для srcset, по возрастанию."""
+    width, height = map(int, geometry.split('x'))
+    return [
+        f'{round(width * scale)}x{round(height * scale)}'
+        for scale in THUMBNAIL_SCALES
+    ]
+
+
+# Основные размеры идут первыми: их страницы запрашивают чаще всего.
+VARIANT_GEOMETRIES = tuple(dict.fromkeys(THUMBNAIL_GEOMETRIES + tuple(
+    variant
+    for geometry in THUMBNAIL_GEOMETRIES
+    for variant in thumbnail_variants(geometry)
+)))
+
+
+def thumbnail_options(format_=None):
+    options = dict(THUMBNAIL_OPTIONS)
+    if format_ is not None:
+        options['format'] = format_
+    return options
+
+
+def generate_thumbnail(name, geometry, format_=None):
+    """Создает миниатюру картинки name, возвращает успех."""
+    try:
+        get_thumbnail(
+            ImageFile(name, image_storage), geometry,
+            **thumbnail_options(format_))
+    except Exception:
+        logger.exception(
+            'Не удалось создать миниатюру %s для %s', geometry, name)
+        return False
+    return True
+
+
+def generate_thumbnails(name):
+    """Создает все варианты миниатюр картинки name, возвращает успех."""
+    return all([
+        generate_thumbnail(name, geometry, format_)
+        for geometry in VARIANT_GEOMETRIES
+        for format_ in THUMBNAIL_FORMATS.values()
+    ])
+
+
+def submit_thumbnails(name):
+    return submit(generate_thumbnails, name)
+
+
+def thumbnail_file(image, geometry, format_=None):
+    """Файл миниатюры, который создаст для картинки sorl-thumbnail.
+
+    Повторяет расчет имени из ThumbnailBackend.get_thumbnail, но не читает
+    ни хранилище ключей, ни файловую систему.
+    """
+    backend = default.backend
+    source = ImageFile(image)
+    options = thumbnail_options(format_)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def mark_thumbnails_used(thumbnails):
+    """Отмечает, что миниатюры только что понадобились странице."""
+    now = time.time()
+    cache.set_many({
+        THUMBNAIL_USED_KEY.format(thumbnail.key): now
+        for thumbnail in thumbnails
+    }, THUMBNAIL_MAX_IDLE)
+
+
+def thumbnail_version(image):
+    """Ключ исходной картинки: меняется, когда картинку заменяют."""
+    return ImageFile(image).key
+
+
+class PostThumbnail:
+    """Варианты миниатюры поста для <picture>: srcset в WebP и в формате
+    исходной картинки.
+
+    Готовые варианты ссылаются на файлы, остальные - на представление
+    post_thumbnail, которое создаст их отдельно от рендеринга страницы.
+    """
+
+    sizes = THUMBNAIL_SIZES
+
+    def __init__(self, post, geometry, ready):
+        self.post = post
+        self.ready = ready
+        self.width, self.height = map(int, geometry.split('x'))
+        self.url = self.variant_url(geometry, 'original', negotiate=True)
+        self.srcset = self.build_srcset(geometry, 'original')
+        self.webp_srcset = self.build_srcset(geometry, 'webp')
+
+    def variant_url(self, geometry, format_name, negotiate=False):
+        thumbnail = self.ready.get((geometry, format_name))
+        if thumbnail is not None:
+            return thumbnail.url
+        url = '{}?v={}'.format(
+            reverse('posts:post_thumbnail', args=(self.post.id, geometry)),
+            thumbnail_version(self.post.image),
+        )
+        if negotiate:
+            return url
+        return f'{url}&format={format_name}'
+
+    def build_srcset(self, geometry, format_name):
+        return ', '.join(
+            '{} {}w'.format(
+                self.variant_url(variant, format_name), variant.split('x')[0])
+            for variant in thumbnail_variants(geometry)
+        )
+
+
+@timing('thumbnail_seconds')
+def prefetch_thumbnails(posts, geometry):
+    """Находит готовые варианты миниатюр постов одним get_many.
+
+    Результат кладется в post.thumbnails[geometry] как PostThumbnail.
+    """
+    keys = {}
+    posts = [post for post in posts if post.image]
+    for post in posts:
+        for variant in thumbnail_variants(geometry):
+            for format_name, format_ in THUMBNAIL_FORMATS.items():
+                key = add_prefix(
+                    thumbnail_file(post.image, variant, format_).key)
+                keys.setdefault(key, []).append((post, variant, format_name))
+    values = default.kvstore.cache.get_many(list(keys)) if keys else {}
+    ready = {post.pk: {} for post in posts}
+    used = []
+    for key, value in values.items():
+        # Отсутствие миниатюры sorl кэширует служебным объектом, не строкой.
+        if not isinstance(value, str):
+            continue
+        thumbnail = deserialize_image_file(value)
+        used.append(thumbnail)
+        for post, variant, format_name in keys[key]:
+            ready[post.pk][variant, format_name] = thumbnail
+    if used:
+        mark_thumbnails_used(used)
+    for post in posts:
+        if not hasattr(post, 'thumbnails'):
+            post.thumbnails = {}
+        post.thumbnails[geometry] = PostThumbnail(
+            post, geometry, ready[post.pk])
+
+
+def get_post_thumbnail(post, geometry):
+    """Миниатюра картинки поста без создания её во время рендеринга."""
+    if not post.image:
+        return None
+    if geometry not in getattr(post, 'thumbnails', {}):
+        prefetch_thumbnails([post], geometry)
+    return post.thumbnails[geometry]
+
+
+def negotiate_format(request):
+    """Имя формата миниатюры: из ?format= или по заголовку Accept."""
+    format_name = request.GET.get('format')
+    if format_name in THUMBNAIL_FORMATS:
+        return format_name
+    if 'image/webp' in request.META.get('HTTP_ACCEPT', ''):
+        return 'webp'
+    return 'original'
+
+
+@timing('thumbnail_seconds')
+def request_thumbnail(image, geometry, format_=None,
+                      deadline=THUMBNAIL_DEADLINE):
+    """Миниатюра, если она готова или успела создаться за deadline секунд.
+
+    Создание запускает только запрос, захвативший блокировку по ключу
+    миниатюры, остальные ждут его результата. Если время вышло, создание
+    продолжается в пуле воркеров, а функция возвращает None. Неудача
+    запоминается на THUMBNAIL_FAILURE_TIMEOUT, и до тех пор миниатюра
+    заново не создается.
+    """
+    thumbnail = thumbnail_file(image, geometry, format_)
+    ready = default.kvstore.get(thumbnail)
+    if ready is not None:
+        mark_thumbnails_used([ready])
+        return ready
+    failure_key = 'thumbnail.failed.' + thumbnail.key
+    if cache.get(failure_key):
+        return None
+    lock_key = 'thumbnail.lock.' + thumbnail.key
+    if cache.add(lock_key, 1, THUMBNAIL_LOCK_TIMEOUT):
+        def done(future):
+            if future.exception() is not None or not future.result():
+                cache.set(failure_key, 1, THUMBNAIL_FAILURE_TIMEOUT)
+            cache.delete(lock_key)
+
+        future = submit(generate_thumbnail, image.name, geometry, format_)
+        future.add_done_callback(done)
+        wait([future], timeout=deadline)
+        return default.kvstore.get(thumbnail)
+    finish = time.monotonic() + deadline
+    while time.monotonic() < finish:
+        time.sleep(THUMBNAIL_POLL)
+        ready = default.kvstore.get(thumbnail)
+        if ready is not None:
+            return ready
+    return None
+
+
+def placeholder_svg(geometry):
+    return PLACEHOLDER_SVG.format(*geometry.split('x'))
@@ -5,11 +5,18 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name="index"),
+    path('search/', views.search, name='search'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments, name='post_comments'),
+    path(
+        'posts/<int:post_id>/thumbnail/<str:geometry>/',
+        views.post_thumbnail, name='post_thumbnail'),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment, name='add_comment'),
@@ -1,17 +1,228 @@
+import base64
+import binascii
+import hashlib
+import time
+
+from django.core.cache import cache
 from django.core.paginator import Paginator
 from django.db import connection, reset_queries
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .caching import get_versions
 
 
 POST_IN_PAGE = 10
+COMMENT_IN_PAGE = 20
+CURSOR_LAST = 'last'
+POSTS_NAMESPACE = 'posts'
+COUNT_CACHE_TIMEOUT = 60 * 60 * 24
+COUNT_ESTIMATE_MIN = 10000
+COUNT_STALE_SECONDS = 60
+PAGES_ON_EACH_SIDE = 3
+PAGES_ON_ENDS = 2
+# Дальше этой страницы ссылки с номером не ведут: OFFSET пролистывал бы
+# почти всю ленту, к её концу ведет курсор before=last.
+NUMBERED_PAGES = 10
+ELLIPSIS = '…'
 
 
-def paginator(queryset, request):
-    paginator = Paginator(queryset, POST_IN_PAGE)
+def encode_cursor(key):
+    """Упаковывает ключ (pub_date, id) в непрозрачный токен."""
+    pub_date, pk = key
+    raw = f'{pub_date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, id) из токена или None, если он испорчен."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        pub_date, pk = raw.decode().split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+def cursor_slice(queryset, key, backward, limit, id_field='id'):
+    """Выбирает limit объектов строго после (или до) ключа key."""
+    if key is not None:
+        pub_date, pk = key
+        if backward:
+            queryset = queryset.filter(pub_date__gte=pub_date).exclude(
+                **{'pub_date': pub_date, f'{id_field}__lte': pk})
+        else:
+            queryset = queryset.filter(pub_date__lte=pub_date).exclude(
+                **{'pub_date': pub_date, f'{id_field}__gte': pk})
+    if backward:
+        queryset = queryset.order_by('pub_date', id_field)
+    else:
+        queryset = queryset.order_by('-pub_date', f'-{id_field}')
+    return list(queryset[:limit])
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор с keyset-режимом по ключу (pub_date, id).
+
+    Кроме обычных страниц по номеру умеет отдавать страницы после или до
+    курсора: каждая такая страница - один проход по диапазону индекса
+    pub_date без OFFSET и без COUNT.
+    """
+    cursor_id_field = 'id'
+
+    def __init__(self, object_list, per_page, **kwargs):
+        super().__init__(
+            object_list.order_by('-pub_date', f'-{self.cursor_id_field}'),
+            per_page, **kwargs)
+
+    def get_page(self, number):
+        page = super().get_page(number)
+        object_list = list(page.object_list)
+        page.object_list = object_list
+        page.next_cursor = (
+            self._encode(object_list[-1]) if page.has_next() else None)
+        page.previous_cursor = (
+            self._encode(object_list[0]) if page.has_previous() else None)
+        return page
+
+    def get_first_cursor_page(self):
+        """Первая страница без номера и без COUNT."""
+        object_list = self._fetch(None, False, self.per_page + 1)
+        return self._cursor_page(
+            object_list[:self.per_page],
+            has_next=len(object_list) > self.per_page,
+            has_previous=False,
+        )
+
+    def get_cursor_page(self, after=None, before=None):
+        if before == CURSOR_LAST:
+            return self._backward_page(None)
+        key = self._decode(before or after or '')
+        if key is None:
+            return self.get_page(1)
+        if before:
+            return self._backward_page(key)
+        object_list = self._fetch(key, False, self.per_page + 1)
+        has_next = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        return self._cursor_page(
+            object_list,
+            has_next=has_next,
+            has_previous=bool(object_list),
+        )
+
+    def _fetch(self, key, backward, limit):
+        return cursor_slice(
+            self.object_list, key, backward, limit, self.cursor_id_field)
+
+    def _encode(self, obj):
+        return encode_cursor(
+            (obj.pub_date, getattr(obj, self.cursor_id_field)))
+
+    def _decode(self, token):
+        return decode_cursor(token)
+
+    def _backward_page(self, key):
+        object_list = self._fetch(key, True, self.per_page + 1)
+        has_previous = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page][::-1]
+        return self._cursor_page(
+            object_list,
+            has_next=key is not None and bool(object_list),
+            has_previous=has_previous,
+        )
+
+    def _cursor_page(self, object_list, has_next, has_previous):
+        page = self._get_page(object_list, None, self)
+        page.next_cursor = (
+            self._encode(object_list[-1]) if has_next else None)
+        page.previous_cursor = (
+            self._encode(object_list[0]) if has_previous else None)
+        return page
+
+
+def cached_count(queryset, namespaces=(POSTS_NAMESPACE,)):
+    """COUNT запроса, закэшированный до следующего изменения постов.
+
+    Для больших лент устаревшее значение ещё COUNT_STALE_SECONDS отдается
+    как оценка, чтобы каждая новая запись не запускала полный пересчет.
+    """
+    sql, params = queryset.values('pk').order_by().query.sql_with_params()
+    key = 'feed_count:' + hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    version = get_versions(*namespaces)
+    cached = cache.get(key)
+    if cached is not None:
+        count_version, count, counted_at = cached
+        if count_version == version:
+            return count
+        if (count >= COUNT_ESTIMATE_MIN
+                and time.time() - counted_at < COUNT_STALE_SECONDS):
+            return count
+    count = queryset.count()
+    cache.set(key, (version, count, time.time()), COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class FeedPaginator(CursorPaginator):
+    """Пагинатор лент с кэшированным счетчиком и окном номеров страниц."""
+
+    ELLIPSIS = ELLIPSIS
+    count_namespaces = (POSTS_NAMESPACE,)
+
+    def __init__(self, object_list, per_page, count_namespaces=None,
+                 **kwargs):
+        if count_namespaces is not None:
+            self.count_namespaces = count_namespaces
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list, self.count_namespaces)
+
+    def get_elided_page_range(self, number):
+        """Номера страниц вокруг текущей, пропуски - ELLIPSIS.
+
+        Номера идут только до NUMBERED_PAGES, хвост ленты заменяет пропуск.
+        """
+        last = min(self.num_pages, NUMBERED_PAGES)
+        if number > last:
+            return list(range(1, PAGES_ON_ENDS + 1)) + [ELLIPSIS, number]
+        start = max(number - PAGES_ON_EACH_SIDE, 1)
+        end = min(number + PAGES_ON_EACH_SIDE, last)
+        pages = []
+        if start > PAGES_ON_ENDS + 2:
+            pages += list(range(1, PAGES_ON_ENDS + 1)) + [ELLIPSIS]
+        else:
+            start = 1
+        pages += list(range(start, end + 1))
+        if end < self.num_pages:
+            pages.append(ELLIPSIS)
+        return pages
+
+    def get_page(self, number):
+        page = super().get_page(number)
+        page.elided_page_range = self.get_elided_page_range(page.number)
+        return page
+
+
+def get_feed_page(paginator, request):
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if after or before:
+        return paginator.get_cursor_page(after=after, before=before)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
 
 
+def paginator(queryset, request):
+    return get_feed_page(FeedPaginator(queryset, POST_IN_PAGE), request)
+
+
 def print_all_queries_decorator(func):
     def wrapper(*args, **kwargs):
         reset_queries()
@@ -21,5 +232,5 @@ def print_all_queries_decorator(func):
             print('SQL:', query_info['sql'])
             print('TIME:', query_info['time'])
             print()
-            return results
+        return results
     return wrapper
@@ -1,16 +1,48 @@
+from urllib.parse import urlencode
+
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
+from django.utils.cache import (
+    add_never_cache_headers, patch_cache_control, patch_vary_headers,
+)
 from .models import Post, Group, Follow
 from django.contrib.auth import get_user_model
 from .forms import PostForm, CommentForm
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
-from .utils import paginator
+from core.query_budget import query_budget
+from .caching import cache_feed
+from .feed import FollowFeedPaginator
+from .images import queue_image_processing
+from .search import SearchPaginator
+from .thumbnails import (
+    THUMBNAIL_FORMATS, VARIANT_GEOMETRIES, negotiate_format,
+    placeholder_svg, request_thumbnail, thumbnail_version,
+)
+from .utils import (
+    COMMENT_IN_PAGE, POST_IN_PAGE, POSTS_NAMESPACE, FeedPaginator,
+    cached_count, get_feed_page, paginator,
+)
 
 User = get_user_model()
-SECONDS_IN_CACHE = 20
+SECONDS_IN_CACHE = 60 * 60 * 6
+THUMBNAIL_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def post_author_namespace(request, post_id):
+    username = User.objects.filter(posts__id=post_id).values_list(
+        'username', flat=True).first()
+    return f'author:{username}'
 
 
-@cache_page(SECONDS_IN_CACHE, key_prefix='index_page')
+def comments_page(post, request):
+    comments = FeedPaginator(
+        post.comments.select_related('author'), COMMENT_IN_PAGE,
+        count_namespaces=(f'post:{post.id}',))
+    return get_feed_page(comments, request)
+
+
+@cache_feed(SECONDS_IN_CACHE, 'index_page', POSTS_NAMESPACE)
+@query_budget(4)
 def index(request):
     title = 'Последние обновления на сайте'
     post_list = Post.objects.select_related('group', 'author')
@@ -21,6 +53,21 @@ def index(request):
     )
 
 
+@cache_feed(SECONDS_IN_CACHE, 'search_page', POSTS_NAMESPACE)
+@query_budget(4)
+def search(request):
+    query = request.GET.get('q', '').strip()
+    search_paginator = SearchPaginator(query, POST_IN_PAGE)
+    return render(
+        request, 'posts/search.html',
+        {'page_obj': get_feed_page(search_paginator, request),
+         'query': query,
+         'pagination_query': urlencode({'q': query}) + '&'},
+    )
+
+
+@cache_feed(SECONDS_IN_CACHE, 'group_page', 'group:{slug}')
+@query_budget(5)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     group_list = group.posts.select_related('author')
@@ -31,6 +78,8 @@ def group_posts(request, slug):
     )
 
 
+@cache_feed(SECONDS_IN_CACHE, 'profile_page', 'author:{username}')
+@query_budget(6)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
     posts = author.posts.select_related('group')
@@ -46,14 +95,52 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@cache_feed(SECONDS_IN_CACHE, 'post_page', 'post:{post_id}',
+            post_author_namespace)
+@query_budget(6)
 def post_detail(request, post_id):
     post = get_object_or_404(Post.objects.select_related('group', 'author'),
                              id=post_id)
-    comments = post.comments.all()
     form = CommentForm(request.POST or None)
+    author_posts_count = cached_count(
+        post.author.posts.all(), (f'author:{post.author.username}',))
     return render(
         request, 'posts/post_detail.html',
-        {'post': post, 'form': form, 'comments': comments})
+        {'post': post, 'form': form,
+         'comments': comments_page(post, request),
+         'author_posts_count': author_posts_count})
+
+
+@cache_feed(SECONDS_IN_CACHE, 'comments_page', 'post:{post_id}')
+@query_budget(5)
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+    return render(
+        request, 'posts/includes/comments.html',
+        {'post': post, 'comments': comments_page(post, request)})
+
+
+def post_thumbnail(request, post_id, geometry):
+    if geometry not in VARIANT_GEOMETRIES:
+        raise Http404
+    post = get_object_or_404(Post.objects.only('image'), id=post_id)
+    if not post.image:
+        raise Http404
+    format_name = negotiate_format(request)
+    thumbnail = request_thumbnail(
+        post.image, geometry, THUMBNAIL_FORMATS[format_name])
+    if thumbnail is None:
+        response = HttpResponse(
+            placeholder_svg(geometry), content_type='image/svg+xml')
+        add_never_cache_headers(response)
+        return response
+    response = FileResponse(thumbnail.storage.open(thumbnail.name))
+    if 'format' not in request.GET:
+        patch_vary_headers(response, ('Accept',))
+    if request.GET.get('v') == thumbnail_version(post.image):
+        patch_cache_control(
+            response, public=True, max_age=THUMBNAIL_MAX_AGE, immutable=True)
+    return response
 
 
 @login_required
@@ -65,6 +152,7 @@ def post_create(request):
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    queue_image_processing(post)
     return redirect('posts:profile', request.user)
 
 
@@ -78,6 +166,8 @@ def post_edit(request, post_id):
                     instance=post)
     if form.is_valid():
         post = form.save()
+        if 'image' in form.changed_data:
+            queue_image_processing(post)
         return redirect('posts:post_detail', post_id)
     return render(request, 'posts/create_post.html',
                   {'form': form, 'is_edit': True, 'post': post})
@@ -98,13 +188,14 @@ def add_comment(request, post_id):
 
 
 @login_required
+@cache_feed(SECONDS_IN_CACHE, 'follow_page', POSTS_NAMESPACE,
+            'follower:{request.user.id}')
+@query_budget(5)
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user).select_related('author', 'group')
+    feed = FollowFeedPaginator(request.user, POST_IN_PAGE)
     return render(
         request, 'posts/follow.html',
-        {'posts': posts,
-         'page_obj': paginator(posts, request)}
+        {'page_obj': get_feed_page(feed, request)}
     )
 
 
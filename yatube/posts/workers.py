@@ -0,0 +1,67 @@
+"""Пул процессов для обработки картинок вне запросов.
+
+Модуль не импортирует модели: воркер загружает его до django.setup().
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+# Настройки, которые воркер берет у родителя, а не из модуля настроек:
+# их меняют override_settings и тестовый раннер.
+WORKER_SETTINGS = ('DATABASES', 'CACHES', 'MEDIA_ROOT')
+
+
+def init_worker(settings_module, overrides):
+    # Воркеры запускаются через spawn и настраивают Django с нуля:
+    # унаследованные через fork соединения с базой использовать нельзя.
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    import django
+    django.setup()
+
+
+def make_executor(workers):
+    overrides = {name: getattr(settings, name) for name in WORKER_SETTINGS}
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_worker,
+        # Под override_settings settings.SETTINGS_MODULE - None.
+        initargs=(os.environ['DJANGO_SETTINGS_MODULE'], overrides),
+    )
+
+
+def get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = make_executor(settings.THUMBNAIL_WORKERS)
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def submit(function, *args):
+    """Запускает function в пуле воркеров или сразу, если их нет."""
+    if not settings.THUMBNAIL_WORKERS:
+        future = Future()
+        future.set_result(function(*args))
+        return future
+    try:
+        return get_executor().submit(function, *args)
+    except BrokenProcessPool:
+        reset_executor()
+        return get_executor().submit(function, *args)
@@ -25,6 +25,7 @@ SECRET_KEY = '8)8xtkjkio3y3_k8#hi#xy!f1io3i973&m(54n^q*h303o8758'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+TEST_RUNNER = 'core.test_runner.TestRunner'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -38,12 +39,33 @@ ALLOWED_HOSTS = [
     'mariooooo37.pythonanywhere.com',
 ]
 
+# Файл кэша общий для процессов одного развертывания: воркеров и команд.
+# Тесты работают со своим временным файлом (core.test_runner).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.TwoTierCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_PATH', os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_BYTES': 256 * 1024 * 1024,
+            'L1_MAX_ENTRIES': 1000,
+        },
     }
 }
 
+# Авторы с таким числом подписчиков не раскладываются по лентам подписок,
+# их посты подмешиваются в ленту при чтении.
+FEED_PULL_FOLLOWERS = 10000
+
+# Процессы, которые создают миниатюры загруженных картинок; 0 - в запросе.
+THUMBNAIL_WORKERS = 2
+# Миниатюры без явного формата сохраняются в формате исходной картинки.
+THUMBNAIL_PRESERVE_FORMAT = True
+
+# Загрузки сразу пишутся на диск кусками, память не зависит от размера.
+FILE_UPLOAD_HANDLERS = ['core.uploads.ImageUploadHandler']
+IMAGE_UPLOAD_MAX_SIZE = 30 * 1024 * 1024
+
 
 # Application definition
 
@@ -59,29 +81,49 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'sorl.thumbnail',
-    'debug_toolbar',
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+if DEBUG:
+    INSTALLED_APPS += ['debug_toolbar']
+    MIDDLEWARE += ['debug_toolbar.middleware.DebugToolbarMiddleware']
+
+# Превышение бюджета запросов core.query_budget: 'off', 'log' или 'raise'.
+QUERY_BUDGETS = 'log' if DEBUG else 'off'
+
+# Заголовок Server-Timing с разбивкой времени запроса (core.metrics). Он
+# раскрывает устройство сервера, поэтому по умолчанию есть только в DEBUG.
+SERVER_TIMING = DEBUG
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
 
+# Адреса через запятую, с которых доступен /metrics (core.metrics). По
+# умолчанию метрики закрыты: за nginx на том же сервере REMOTE_ADDR любого
+# запроса - 127.0.0.1, поэтому локальный адрес здесь открыл бы их всем.
+METRICS_ALLOWED_IPS = [
+    address.strip() for address in
+    os.environ.get('YATUBE_METRICS_ALLOWED_IPS', '').split(',')
+    if address.strip()
+]
+
 ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.InstrumentedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -106,7 +148,37 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 60 * 10,
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'CONN_MAX_AGE': 60 * 10,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+
+# Реплики для чтения; их обновляет manage.py sync_replicas --interval.
+REPLICA_DATABASES = ['replica']
+# Представления, которые читают из реплик, и модели, которые там читаются.
+REPLICA_VIEWS = [
+    'posts:index', 'posts:group_list', 'posts:profile', 'posts:post_detail',
+]
+REPLICA_APPS = ['posts', 'auth']
+# Реплика, отстающая сильнее, не используется; столько же после своей
+# записи пользователь читает из основной базы, пока реплика не догонит.
+REPLICA_MAX_LAG = 30
+
+# Выполняются на каждом новом соединении с SQLite (core.db).
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - размер кэша страниц в КиБ.
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
 }
 
 